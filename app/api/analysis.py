@@ -1,13 +1,25 @@
-import os
+import uuid
 import logging
-import json
-from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Dict, Any, List
+import asyncio
+import hashlib
+from collections import Counter
+from functools import lru_cache
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from typing import Dict, Any, List, Optional
+import httpx
+import orjson
 from openai import AsyncAzureOpenAI
 
+from app.config import settings
+
 # Use the robust, async-safe graph_service to prevent WebSocket crashes
 from app.services.graph_service import graph_service
+from app.services.graph_analytics import graph_analytics, COMMUNITY_SUMMARY_CONCURRENCY
+from app.utils.cache import TTLCache
+from app.utils.circuit_breaker import CircuitBreaker
+from app.db.result_cache import ResultCache, graph_version
 
 # Define Router
 router = APIRouter(prefix="/api/graph", tags=["Analysis"])
@@ -16,23 +28,147 @@ logger = logging.getLogger(__name__)
 # --- REQUEST MODEL ---
 class AnalyzeRequest(BaseModel):
     nodeId: str 
+    stream: bool = False  # True => Server-Sent Events (tokens pushed as they are generated)
+
+# Client-chosen summary fan-out is capped: each slot is a concurrent Gremlin read + Azure OpenAI call
+COMMUNITY_MAX_CONCURRENCY = 20
+
+class CommunityJobRequest(BaseModel):
+    force: bool = False  # re-summarize every cluster, ignoring cached results/fingerprints
+    concurrency: int = Field(COMMUNITY_SUMMARY_CONCURRENCY, ge=1, le=COMMUNITY_MAX_CONCURRENCY)
+
+# --- GREMLIN QUERY (static text, node id passed as binding 'nid') ---
+# Early-termination caps so hub nodes with thousands of edges don't scan
+# (and bill RUs for) their whole neighbourhood; the prompt only needs a sample.
+ANALYSIS_EDGE_LIMIT = 100     # 1-hop edges (and their neighbours) in the timeline
+RISK_CHAIN_LIMIT = 25         # Cause/Effect edges listed in the risk chain
+STATS_SCAN_LIMIT = 1000       # neighbours sampled for the label distribution
+
+# Output budget grows with the context: sparse nodes get short summaries (generation time is linear in tokens)
+BASE_MAX_TOKENS = 250
+MAX_TOKENS_PER_EVENT = 20
+MAX_EXTRA_TOKENS = 400
+
+# Single multi-projection traversal: core node, chronological 1-hop timeline,
+# cause/effect chain and network stats come back in ONE response.
+# The timeline is ordered server-side and already carries the neighbour's name/type.
+QUERY_ANALYSIS_CONTEXT = (
+    "g.V(nid).project('node', 'timeline', 'risks', 'stats')"
+    ".by(project('props', 'label').by(valueMap()).by(label))"
+    f".by(bothE().limit({ANALYSIS_EDGE_LIMIT}).dedup()"
+    ".order().by(coalesce(values('timestamp'), constant('Unknown Date'))).as('e')"
+    ".otherV().project('timestamp', 'label', 'target_name', 'target_type')"
+    ".by(select('e').coalesce(values('timestamp'), constant('Unknown Date')))"
+    ".by(select('e').label()).by(coalesce(values('name'), id())).by(label).fold())"
+    ".by(union(identity(), out('PERFORMS')).bothE()"
+    f".has('riskCategory', within('Cause', 'Effect')).dedup().limit({RISK_CHAIN_LIMIT})"
+    ".project('edge_label', 'source_name', 'target_name')"
+    ".by(label).by(outV().coalesce(values('name'), id())).by(inV().coalesce(values('name'), id())).fold())"
+    f".by(both().limit({STATS_SCAN_LIMIT}).label().groupCount())"
+)
+
+# RCA export is paged (bindings 'lo'/'hi'); pages are fetched concurrently
+EXPORT_RCA_PAGE_SIZE = 200
+EXPORT_RCA_CONCURRENCY = 4
+
+QUERY_EXPORT_RCA_COUNT = "g.V().hasLabel('Case').has('rca_report').count()"
+
+QUERY_EXPORT_RCA = (
+    "g.V().hasLabel('Case').has('rca_report').order().by(id).range(lo, hi)"
+    ".project('Case_ID', 'Root_Cause', 'Business_Effect', 'AI_Analysis_Report')"
+    ".by(coalesce(values('name'), id()))"
+    ".by(coalesce(out('HAS_ROOT_CAUSE').values('name'), constant('N/A')))"
+    ".by(coalesce(out('HAS_BUSINESS_EFFECT').values('name'), constant('N/A')))"
+    ".by('rca_report')"
+)
+
+# --- PROMPTS (built once at import; per request only the placeholders are filled) ---
+SYSTEM_PROMPT = """You are an elite Enterprise Process Mining & Risk Analyst AI. 
+Your objective is to analyze Knowledge Graph data to deliver high-impact, C-level business intelligence.
+You must align your analysis with core organizational missions: Operational Excellence, Customer Retention, and Risk Mitigation.
+
+CRITICAL RULES:
+1. Connect the dots: If multiple events share the EXACT SAME timestamp, they represent a single unified action.
+2. Identify anomalies: Pay close attention to the CAUSE and EFFECT chain. If an activity caused an anomaly, highlight it immediately.
+3. Be decisive: Provide solutions that balance operational efficiency with customer satisfaction.
+"""
+
+# Invariant instructions go right after the system message; only the entity
+# report that follows them changes per request. Keeping this prefix
+# byte-identical lets Azure OpenAI prompt caching reuse it across calls.
+INSTRUCTIONS_PROMPT = """INSTRUCTIONS:
+You will receive an ENTITY REPORT in the next message. Perform a deep-dive analysis on that entity.
+Write a highly professional, visually clean, and EXTREMELY CONCISE Markdown report. 
+Clients do not have time to read long paragraphs. You MUST use short bullet points, bold keywords, and punchy sentences.
+Use EXACTLY these four sections:
+
+### The Bottom Line
+Maximum 2 sentences summarizing the entity's business value and its primary risk/bottleneck.
+
+### Timeline at a Glance
+Maximum 4 short bullet points mapping the journey. Highlight products, amounts, and locations clearly.
+
+### Key Risks & Anomalies
+2 to 3 short bullet points highlighting specific friction points. You MUST mention any triggers found in the CAUSE & EFFECT RISK CHAIN of the entity report.
+
+### Action Plan
+2 punchy, highly specific business recommendations to fix the root cause or prevent future revenue leakage.
+"""
+
+USER_PROMPT_TMPL = """ENTITY REPORT:
+
+[CORE IDENTITY]
+- Entity Name: {name}
+- Entity Type: {label}
+- Current Risk Flag: {risk}
+
+[CHRONOLOGICAL TIMELINE (INTERACTION HISTORY)]
+{timeline}
+
+[CAUSE & EFFECT RISK CHAIN]
+{risk_chain}
+
+[GLOBAL NETWORK STATISTICS (COMPARATIVE DB DATA)]
+This entity is connected to the following types of nodes across the database:
+{network_stats}
+"""
 
 # --- CONFIGURATION ---
-AZURE_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
-AZURE_API_KEY = os.getenv("AZURE_OPENAI_API_KEY")
-AZURE_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
-AZURE_API_VERSION = os.getenv("AZURE_OPENAI_API_VERSION", "2024-02-15-preview")
+# From settings (pydantic-settings reads .env itself, no load_dotenv needed)
+AZURE_ENDPOINT = settings.AZURE_OPENAI_ENDPOINT
+AZURE_API_KEY = settings.AZURE_OPENAI_API_KEY
+AZURE_DEPLOYMENT = settings.AZURE_OPENAI_DEPLOYMENT_NAME
+AZURE_API_VERSION = settings.AZURE_OPENAI_API_VERSION  # 2024-10-01-preview or later gets automatic prompt caching
+
+# Debug override: send even risk-free ("Stable") nodes to the LLM
+FORCE_AI = settings.FORCE_AI
+STABLE_RISK_LEVELS = {"Unknown", "Low"}
+
+# Analyses answered without the LLM, by reason ("isolated" / "stable"), for observability
+llm_skips: Counter = Counter()
 
 ai_client = None
+ai_http_client = None
 USE_REAL_AI = False
 
 try:
     if AZURE_ENDPOINT and AZURE_API_KEY and AZURE_DEPLOYMENT:
         logger.info(f"Initializing Azure OpenAI Client (Deployment: {AZURE_DEPLOYMENT})...")
+        # Tuned pool: HTTP/2 multiplexing + long keepalive so calls skip the TLS handshake.
+        # Concurrent /analyze calls already share these connections; there is deliberately no
+        # coalescing window in front of them (chat completions cannot be merged upstream, so a
+        # window would only add its wait to every call).
+        ai_http_client = httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=500, max_keepalive_connections=100, keepalive_expiry=60),
+            timeout=httpx.Timeout(30.0, connect=5.0)
+        )
         ai_client = AsyncAzureOpenAI(
             api_key=AZURE_API_KEY,
             api_version=AZURE_API_VERSION,
-            azure_endpoint=AZURE_ENDPOINT
+            azure_endpoint=AZURE_ENDPOINT,
+            http_client=ai_http_client,
+            max_retries=2  # SDK retries transient 429/5xx with exponential backoff + jitter
         )
         USE_REAL_AI = True
     else:
@@ -40,193 +176,382 @@ try:
 except Exception as e:
     logger.error(f"AI Client Init Failed: {e}")
 
+# Resolved once at import: the client/config never change per request
+AI_ENABLED = USE_REAL_AI and ai_client is not None
+
+async def close_ai_client():
+    """Closes the pooled HTTP connections of the analysis client (app shutdown)."""
+    if ai_http_client:
+        await ai_http_client.aclose()
+
+# --- RESPONSE CACHE ---
+# Identical graph context => identical prompt => reuse the previous LLM summary.
+summary_cache = TTLCache(maxsize=10_000, ttl=3600)
+
+# Whole-response cache keyed by (node_id, graph_version), shared across workers via Redis
+analysis_result_cache = ResultCache("analyze", ttl=3600)
+ANALYSIS_FILL_LOCK_SECONDS = 30  # upper bound on one analysis (Gremlin + LLM)
+
+# After 5 consecutive AI failures, skip straight to the logic summary for 30s
+ai_breaker = CircuitBreaker("azure-openai-analysis", fail_max=5, reset_timeout=30)
+
+# --- SINGLE-FLIGHT ---
+# Concurrent /analyze calls for the same node (double clicks, several tabs)
+# share one in-flight computation instead of each hitting Gremlin + the LLM.
+_inflight: Dict[str, asyncio.Task] = {}
+
 @router.post("/analyze")
 async def analyze_node(body: AnalyzeRequest) -> Dict[str, Any]:
     node_id = body.nodeId
-    logger.info(f"Analyzing node: {node_id}")
 
     try:
-        # ---------------------------------------------------------
-        # STEP 1: FETCH CORE NODE DETAILS
-        # ---------------------------------------------------------
-        target_query = f"g.V('{node_id}').project('props', 'label').by(valueMap()).by(label)"
-        target_result = await graph_service._run_query_list(target_query)
-        
-        if not target_result:
-            return {"summary": f"Node '{node_id}' could not be located for analysis."}
-            
-        target_node = target_result[0]
-        node_label = target_node.get('label', 'Unknown')
-        node_props = format_properties(target_node.get('props', {}))
-        node_name = node_props.get('name') or node_id
-        node_risk = node_props.get('riskLevel', 'Unknown')
-
-        # ---------------------------------------------------------
-        # STEP 2: DYNAMIC CONTEXT GATHERING (Enterprise GraphRAG)
-        # ---------------------------------------------------------
-        
-        # A. Fetch 1-Hop Timeline (The Star Model Edges)
-        neighbors = await graph_service.get_neighbors(node_id)
-        
-        timeline_events = []
-        connected_nodes_map = {n['id']: n for n in neighbors.get('nodes', [])}
-        
-        for edge in neighbors.get('edges', []):
-            target_id = edge['to'] if edge['from'] == node_id else edge['from']
-            target_node = connected_nodes_map.get(target_id, {})
-            
-            target_name = target_node.get('properties', {}).get('name', target_id)
-            target_type = target_node.get('label', 'Unknown')
-            rel_label = edge.get('label', 'LINKED_TO')
-            timestamp = edge.get('properties', {}).get('timestamp', 'Unknown Date')
-            
-            timeline_events.append({
-                "date": timestamp,
-                "desc": f"[{timestamp}] {rel_label} -> {target_name} ({target_type})"
-            })
-            
-        # Sort chronologically
-        timeline_events.sort(key=lambda x: x["date"])
-        timeline_text = "\n".join([e["desc"] for e in timeline_events]) if timeline_events else "No historical interactions found."
-
-        # B. Fetch Cause & Effect Chain (Risk Analysis)
-        risk_query = f"""
-        g.V('{node_id}').union(identity(), out('PERFORMS')).bothE().has('riskCategory', within('Cause', 'Effect')).dedup().project('edge_label', 'source_name', 'target_name').by(label).by(outV().coalesce(values('name'), id())).by(inV().coalesce(values('name'), id()))
-        """
-        risk_results = await graph_service._run_query_list(risk_query)
-        
-        risk_chain_text = ""
-        if risk_results:
-            chain_events = []
-            for r in risk_results:
-                chain_events.append(f"- {r['source_name']} [{r['edge_label']}] -> {r['target_name']}")
-            risk_chain_text = "\n".join(chain_events)
-        else:
-            risk_chain_text = "- No critical Cause/Effect anomalies detected in this entity's immediate workflow."
-
-        # C. Fetch Network Statistics (Comparative DB Analysis)
-        stats_query = f"g.V('{node_id}').both().label().groupCount()"
-        stats_result = await graph_service._run_query_list(stats_query)
-        network_stats = str(stats_result[0]) if stats_result else "No broader network stats available."
-
-        # ---------------------------------------------------------
-        # STEP 3: ELITE ENTERPRISE PROMPTING
-        # ---------------------------------------------------------
-        system_prompt = """You are an elite Enterprise Process Mining & Risk Analyst AI. 
-        Your objective is to analyze Knowledge Graph data to deliver high-impact, C-level business intelligence.
-        You must align your analysis with core organizational missions: Operational Excellence, Customer Retention, and Risk Mitigation.
-        
-        CRITICAL RULES:
-        1. Connect the dots: If multiple events share the EXACT SAME timestamp, they represent a single unified action.
-        2. Identify anomalies: Pay close attention to the CAUSE and EFFECT chain. If an activity caused an anomaly, highlight it immediately.
-        3. Be decisive: Provide solutions that balance operational efficiency with customer satisfaction.
-        """
-        
-        user_prompt = f"""
-        PERFORM A DEEP-DIVE ANALYSIS ON THE FOLLOWING ENTITY:
-        
-        [CORE IDENTITY]
-        - Entity Name: {node_name}
-        - Entity Type: {node_label}
-        - Current Risk Flag: {node_risk}
+        # A token stream belongs to a single client, so it cannot be shared or cached
+        if body.stream:
+            result = await _analyze_node(node_id, stream=True)
+            if isinstance(result, dict):
+                # Logic/fallback answers go out as one SSE frame so stream clients parse a single format
+                return StreamingResponse(stream_static(result["summary"]), media_type="text/event-stream")
+            return result
 
-        [CHRONOLOGICAL TIMELINE (INTERACTION HISTORY)]
-        {timeline_text}
+        # Cross-worker cache: any graph write bumps the version and invalidates the entry
+        cache_key = f"{node_id}:{await graph_version.current()}"
+        cached = await analysis_result_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Analysis cache hit for node: %s", node_id)
+            return {**cached, "cached": True}
 
-        [CAUSE & EFFECT RISK CHAIN]
-        {risk_chain_text}
-
-        [GLOBAL NETWORK STATISTICS (COMPARATIVE DB DATA)]
-        This entity is connected to the following types of nodes across the database:
-        {network_stats}
-
-        INSTRUCTIONS:
-        Write a highly professional, visually clean, and EXTREMELY CONCISE Markdown report. 
-        Clients do not have time to read long paragraphs. You MUST use short bullet points, bold keywords, and punchy sentences.
-        Use EXACTLY these four sections:
-        
-        ### The Bottom Line
-        Maximum 2 sentences summarizing the entity's business value and its primary risk/bottleneck.
-        
-        ### Timeline at a Glance
-        Maximum 4 short bullet points mapping the journey. Highlight products, amounts, and locations clearly.
-        
-        ### Key Risks & Anomalies
-        2 to 3 short bullet points highlighting specific friction points. You MUST mention any triggers found in the CAUSE & EFFECT RISK CHAIN provided above.
-        
-        ### Action Plan
-        2 punchy, highly specific business recommendations to fix the root cause or prevent future revenue leakage.
-        """
-
-        # ---------------------------------------------------------
-        # STEP 4: GENERATE SUMMARY
-        # ---------------------------------------------------------
-        summary = ""
-        if USE_REAL_AI and ai_client:
-            try:
-                logger.info("Sending Enterprise GraphRAG prompt to Azure OpenAI...")
-                response = await ai_client.chat.completions.create(
-                    model=AZURE_DEPLOYMENT,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
-                    max_tokens=650,
-                    temperature=0.3 
-                )
-                summary = response.choices[0].message.content
-            except Exception as ai_e:
-                logger.error(f"Azure AI Call Failed: {ai_e}. Reverting to logic.")
-                summary = generate_logic_summary(node_name, node_label, timeline_events, network_stats, risk_chain_text)
+        task = _inflight.get(node_id)
+        if task is None:
+            task = asyncio.create_task(_analyze_shared(node_id, cache_key))
+            _inflight[node_id] = task
+            task.add_done_callback(lambda _: _inflight.pop(node_id, None))
         else:
-            summary = generate_logic_summary(node_name, node_label, timeline_events, network_stats, risk_chain_text)
+            logger.info("Joining in-flight analysis for node: %s", node_id)
 
-        return {"summary": summary}
+        # shield(): one caller disconnecting must not cancel the work for the others
+        return await asyncio.shield(task)
 
     except Exception as e:
         logger.error(f"Analysis Endpoint Failed: {e}")
         return {"summary": f"Analysis unavailable due to server error. Details: {str(e)}"}
 
+async def _analyze_shared(node_id: str, cache_key: str) -> Dict[str, Any]:
+    """
+    Cross-worker single-flight: the worker holding the Redis fill lock computes,
+    the others wait for its cached result (and compute themselves if it never lands).
+    """
+    if not await analysis_result_cache.acquire_fill_lock(cache_key, ttl=ANALYSIS_FILL_LOCK_SECONDS):
+        logger.info("Waiting for another worker's analysis of node: %s", node_id)
+        cached = await analysis_result_cache.wait_for(cache_key, timeout=ANALYSIS_FILL_LOCK_SECONDS)
+        if cached is not None:
+            return {**cached, "cached": True}
+        return await _analyze_node(node_id, result_key=cache_key)
+
+    try:
+        return await _analyze_node(node_id, result_key=cache_key)
+    finally:
+        await analysis_result_cache.release_fill_lock(cache_key)
+
+async def _remember(result_key: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Stores a definitive result in the shared cache (skipped for streams/fallbacks)."""
+    if result_key:
+        await analysis_result_cache.set(result_key, result)
+    return result
+
+async def _analyze_node(node_id: str, stream: bool = False, result_key: str = None) -> Dict[str, Any]:
+    logger.info("Analyzing node: %s", node_id)
+
+    # ---------------------------------------------------------
+    # STEP 1: FETCH CORE NODE DETAILS + CONTEXT (ONE ROUND-TRIP)
+    # ---------------------------------------------------------
+    context_result = await graph_service._run_query_list(QUERY_ANALYSIS_CONTEXT, {"nid": node_id})
+    
+    if not context_result:
+        return {"summary": f"Node '{node_id}' could not be located for analysis."}
+
+    context = context_result[0]
+    target_node = context.get('node') or {}
+    risk_results = context.get('risks') or []
+    stats = context.get('stats')
+
+    node_label = target_node.get('label', 'Unknown')
+    node_props = format_properties(target_node.get('props', {}))
+    node_name = node_props.get('name') or node_id
+    node_risk = node_props.get('riskLevel', 'Unknown')
+
+    # ---------------------------------------------------------
+    # STEP 2: DYNAMIC CONTEXT GATHERING (Enterprise GraphRAG)
+    # ---------------------------------------------------------
+    
+    # A. 1-Hop Timeline (The Star Model Edges), already in chronological order
+    timeline_events = [
+        f"[{e['timestamp']}] {e['label']} -> {e['target_name']} ({e['target_type']})"
+        for e in context.get('timeline') or []
+    ]
+    timeline_text = "\n".join(timeline_events) or "No historical interactions found."
+
+    # B. Cause & Effect Chain (Risk Analysis)
+    risk_chain_text = "\n".join(
+        f"- {r['source_name']} [{r['edge_label']}] -> {r['target_name']}" for r in risk_results
+    ) or "- No critical Cause/Effect anomalies detected in this entity's immediate workflow."
+
+    # C. Network Statistics (Comparative DB Analysis)
+    network_stats = str(stats) if stats is not None else "No broader network stats available."
+
+    # Zero-context short-circuits (before any prompt is built). The LLM would only restate
+    # the logic summary, so answer from it and skip the round-trip:
+    # - isolated node: no edges and no Cause/Effect chain at all
+    # - stable node: no Cause/Effect edges and no elevated risk flag
+    if not FORCE_AI and not risk_results:
+        skip_reason = "isolated" if not timeline_events else "stable" if str(node_risk) in STABLE_RISK_LEVELS else None
+        if skip_reason:
+            llm_skips[skip_reason] += 1
+            logger.info("%s node %s: skipping LLM call (skipped so far: %s)", skip_reason.capitalize(), node_id, dict(llm_skips))
+            return await _remember(result_key, {"summary": generate_logic_summary(node_name, node_label, timeline_events, network_stats, risk_chain_text)})
+
+    # ---------------------------------------------------------
+    # STEP 3: ELITE ENTERPRISE PROMPTING
+    # ---------------------------------------------------------
+    user_prompt = USER_PROMPT_TMPL.format_map({
+        "name": node_name,
+        "label": node_label,
+        "risk": node_risk,
+        "timeline": timeline_text,
+        "risk_chain": risk_chain_text,
+        "network_stats": network_stats,
+    })
+
+    # ---------------------------------------------------------
+    # STEP 4: GENERATE SUMMARY
+    # ---------------------------------------------------------
+    summary = ""
+
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": INSTRUCTIONS_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+    if AI_ENABLED:
+        max_tokens = summary_token_budget(len(timeline_events), len(risk_results))
+        cache_key = build_cache_key(node_id, node_label, node_name, node_risk, timeline_text, risk_chain_text, network_stats)
+        cached = summary_cache.get(cache_key)
+        if cached is not None:
+            logger.info("Summary cache hit for %s (hits=%d, misses=%d)", node_id, summary_cache.hits, summary_cache.misses)
+
+        if stream:
+            meta = {"nodeId": node_id, "name": node_name, "type": node_label, "riskLevel": node_risk, "riskChain": risk_chain_text}
+            fallback = lambda: generate_logic_summary(node_name, node_label, timeline_events, network_stats, risk_chain_text)
+            return StreamingResponse(
+                stream_summary(messages, cache_key, meta, cached, fallback, max_tokens),
+                media_type="text/event-stream"
+            )
+
+        if cached is not None:
+            return await _remember(result_key, {"summary": cached})
+
+        if not ai_breaker.allow():
+            logger.warning("Azure OpenAI circuit open. Using logic summary.")
+            return {"summary": generate_logic_summary(node_name, node_label, timeline_events, network_stats, risk_chain_text)}
+
+        try:
+            logger.info("Sending Enterprise GraphRAG prompt to Azure OpenAI...")
+            response = await ai_client.chat.completions.create(
+                model=AZURE_DEPLOYMENT,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0.3 
+            )
+            ai_breaker.record_success()
+            log_prompt_cache_usage(response)
+            summary = response.choices[0].message.content
+            if summary:
+                summary_cache.set(cache_key, summary)
+                return await _remember(result_key, {"summary": summary})
+        except Exception as ai_e:
+            ai_breaker.record_failure()
+            logger.error(f"Azure AI Call Failed: {ai_e}. Reverting to logic.")
+            summary = generate_logic_summary(node_name, node_label, timeline_events, network_stats, risk_chain_text)
+        except BaseException:
+            # Cancelled mid-call (client gone): neither outcome, but free a half-open trial
+            ai_breaker.release()
+            raise
+    else:
+        summary = generate_logic_summary(node_name, node_label, timeline_events, network_stats, risk_chain_text)
+        return await _remember(result_key, {"summary": summary})
+
+    return {"summary": summary}
+
 # --- NEW ENDPOINT: EXPORT RCA REPORTS ---
 @router.get("/export-rca")
-async def export_rca_reports():
+async def export_rca_reports(
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=EXPORT_RCA_PAGE_SIZE * 10)
+) -> Dict[str, Any]:
     """
     Retrieves pre-computed Root Cause Analysis reports for all flagged Cases.
     This does NOT trigger AI costs; it reads results already saved in the DB.
-    """
-    query = """
-    g.V().hasLabel('Case').has('rca_report')
-      .project('Case_ID', 'Root_Cause', 'Business_Effect', 'AI_Analysis_Report')
-      .by(coalesce(values('name'), id()))
-      .by(coalesce(out('HAS_ROOT_CAUSE').values('name'), constant('N/A')))
-      .by(coalesce(out('HAS_BUSINESS_EFFECT').values('name'), constant('N/A')))
-      .by('rca_report')
+    With 'limit' only that page is read; otherwise all pages are fetched concurrently.
     """
     try:
-        results = await graph_service._run_query_list(query)
-        return {"data": results}
+        if limit:
+            results = await graph_service._run_query_list(QUERY_EXPORT_RCA, {"lo": skip, "hi": skip + limit})
+            return {"data": results}
+
+        total = await graph_service._run_query(QUERY_EXPORT_RCA_COUNT) or 0
+        semaphore = asyncio.Semaphore(EXPORT_RCA_CONCURRENCY)
+
+        async def fetch_page(lo: int) -> List[Any]:
+            async with semaphore:
+                return await graph_service._run_query_list(
+                    QUERY_EXPORT_RCA, {"lo": lo, "hi": lo + EXPORT_RCA_PAGE_SIZE}
+                )
+
+        async with asyncio.TaskGroup() as tg:
+            pages = [tg.create_task(fetch_page(lo)) for lo in range(skip, total, EXPORT_RCA_PAGE_SIZE)]
+
+        return {"data": [row for page in pages for row in page.result()]}
     except Exception as e:
         logger.error(f"Export failed: {e}")
         raise HTTPException(status_code=500, detail="Failed to retrieve database reports.")
 
+# --- COMMUNITY DETECTION JOBS ---
+# Detection can take minutes (one LLM call per changed cluster): it runs in the background and
+# the client polls. Job state lives in the shared result cache, so any worker can answer a poll.
+community_jobs = ResultCache("community_jobs", ttl=600)
+_community_tasks: set = set()
+
+@router.post("/communities", status_code=202)
+async def start_community_detection(body: CommunityJobRequest) -> Dict[str, Any]:
+    """Starts community detection in the background and returns the job id to poll."""
+    job_id = str(uuid.uuid4())
+    await community_jobs.set(job_id, {"status": "running"})
+    task = asyncio.create_task(_run_community_job(job_id, body.force, body.concurrency))
+    _community_tasks.add(task)
+    task.add_done_callback(_community_tasks.discard)
+    return {"job_id": job_id, "status": "running"}
+
+@router.get("/communities/{job_id}")
+async def community_detection_status(job_id: str) -> Dict[str, Any]:
+    """{'status': 'running' | 'done' | 'failed', 'result'?: ..., 'error'?: ...}"""
+    job = await community_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired job")
+    return job
+
+async def _run_community_job(job_id: str, force: bool, concurrency: int) -> None:
+    try:
+        result = await graph_analytics.detect_communities(force=force, concurrency=concurrency)
+        await community_jobs.set(job_id, {"status": "done", "result": result})
+    except Exception as e:
+        logger.exception("Community detection job %s failed: %s", job_id, e)
+        await community_jobs.set(job_id, {"status": "failed", "error": str(e)})
+
+# --- STREAMING ---
+def _sse(payload: Any) -> str:
+    return f"data: {orjson.dumps(payload).decode()}\n\n"
+
+async def stream_summary(messages, cache_key, meta, cached, fallback, max_tokens):
+    """
+    SSE generator for /analyze with stream=True.
+    Frames: one 'meta' frame (graph context), 'delta' frames (tokens), then [DONE].
+    Falls back to the logic summary if the LLM fails before sending any token.
+    """
+    yield _sse({"type": "meta", **meta})
+
+    if cached is not None:
+        yield _sse({"type": "delta", "content": cached})
+        yield "data: [DONE]\n\n"
+        return
+
+    if not ai_breaker.allow():
+        logger.warning("Azure OpenAI circuit open. Streaming logic summary.")
+        yield _sse({"type": "delta", "content": fallback()})
+        yield "data: [DONE]\n\n"
+        return
+
+    parts = []
+    settled = False
+    try:
+        logger.info("Streaming Enterprise GraphRAG prompt to Azure OpenAI...")
+        stream = await ai_client.chat.completions.create(
+            model=AZURE_DEPLOYMENT,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=0.3,
+            stream=True
+        )
+        async for chunk in stream:
+            # Azure sends a leading content-filter chunk without choices
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                parts.append(delta)
+                yield _sse({"type": "delta", "content": delta})
+
+        ai_breaker.record_success()
+        settled = True
+        summary = "".join(parts)
+        if summary:
+            summary_cache.set(cache_key, summary)
+    except Exception as ai_e:
+        ai_breaker.record_failure()
+        settled = True
+        logger.error(f"Azure AI Stream Failed: {ai_e}. Reverting to logic.")
+        if not parts:
+            yield _sse({"type": "delta", "content": fallback()})
+    finally:
+        # Client disconnects surface as GeneratorExit/CancelledError, which skip both branches above
+        if not settled:
+            ai_breaker.release()
+
+    yield "data: [DONE]\n\n"
+
+async def stream_static(summary: str):
+    """SSE generator for answers that are already complete (no LLM token stream)."""
+    yield _sse({"type": "delta", "content": summary})
+    yield "data: [DONE]\n\n"
+
 # --- HELPERS ---
+def summary_token_budget(event_count: int, risk_count: int) -> int:
+    """max_tokens for the summary: 250 for a bare node, up to 650 for a busy one."""
+    return BASE_MAX_TOKENS + min((event_count + risk_count) * MAX_TOKENS_PER_EVENT, MAX_EXTRA_TOKENS)
+
+def log_prompt_cache_usage(response):
+    """Logs how many prompt tokens were served from Azure's prompt cache."""
+    usage = getattr(response, "usage", None)
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    cached_tokens = getattr(details, "cached_tokens", None) if details else None
+    if cached_tokens is not None:
+        logger.info("Prompt tokens: %s (cached: %s)", usage.prompt_tokens, cached_tokens)
+
+def build_cache_key(*parts) -> str:
+    """Stable hash of the structured prompt inputs."""
+    raw = orjson.dumps(parts, option=orjson.OPT_SORT_KEYS, default=str)
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
 def format_properties(props):
-    clean = {}
-    for k, v in props.items():
-        if isinstance(v, list) and len(v) > 0: clean[k] = v[0]
-        else: clean[k] = v
-    return clean
+    """Unwraps Gremlin's single-item property lists ({'name': ['John']} -> {'name': 'John'})."""
+    # 'type(v) is list' is an exact check: cheaper than isinstance on the hot (always-list) path
+    return {k: (v[0] if type(v) is list and v else v) for k, v in props.items()}
 
 # --- FALLBACK LOGIC (Emoji-free) ---
 def generate_logic_summary(name, label, timeline, stats, risk_chain):
+    # Only the first 5 events and the total count reach the text, so that is all the cache key needs
+    return _render_logic_summary(
+        name, label, tuple(timeline[:5]), len(timeline), str(stats), risk_chain
+    )
+
+@lru_cache(maxsize=4096)
+def _render_logic_summary(name, label, first_events, total_events, stats, risk_chain):
     summary = f"### The Bottom Line\nThis entity is identified as **{name}** (Type: {label}). It serves as a standard operational node within the network.\n\n"
     
     summary += "### Timeline at a Glance\n"
-    if timeline:
-        for event in timeline[:5]: 
-            summary += f"- {event['desc']}\n"
-        if len(timeline) > 5:
-            summary += f"- ...and {len(timeline)-5} more interactions.\n"
+    if first_events:
+        for desc in first_events: 
+            summary += f"- {desc}\n"
+        if total_events > 5:
+            summary += f"- ...and {total_events-5} more interactions.\n"
     else:
         summary += "- No historical interactions found in the graph.\n"
 
@@ -241,4 +566,4 @@ def generate_logic_summary(name, label, timeline, stats, risk_chain):
     summary += "- Audit Workflow: Investigate the timeline and anomalies above to ensure compliance.\n"
     summary += "- Data Enrichment: Integrate broader demographic data to enable full LLM analysis.\n"
         
-    return summary
\ No newline at end of file
+    return summary
@@ -1,22 +1,32 @@
+from typing import Dict, Any
 from fastapi import APIRouter, Body, HTTPException
 from app.services.graph_service import graph_service
 
-# Remove inner prefix so main.py controls the URL (e.g., POST /clear)
+# Remove inner prefix so main.py controls the URL (e.g., POST /api/clear)
 router = APIRouter(tags=["Admin"])
 
+# Legacy root endpoint (POST /clear), kept for older UI builds
+root_router = APIRouter(tags=["Admin"])
+
+# Built once at import instead of per request
+VALID_SCOPES = frozenset({"all", "documents", "entities", "relationships"})
+_VALID_SCOPES_TEXT = ", ".join(sorted(VALID_SCOPES))
+
+def _validate_scope(scope: str) -> None:
+    if scope not in VALID_SCOPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid scope value. Must be one of: {_VALID_SCOPES_TEXT}",
+        )
+
 @router.post("") 
 async def clear_graph(scope: str = Body(default="all", embed=True)):
     """
     Clear graph data.
-    URL: POST /clear
+    URL: POST /api/clear
     """
     # 1. Validation Logic
-    valid_scopes = {"all", "documents", "entities", "relationships"}
-    if scope not in valid_scopes:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid scope value. Must be one of: {', '.join(valid_scopes)}",
-        )
+    _validate_scope(scope)
 
     try:
         # 2. Business Logic Execution
@@ -33,4 +43,22 @@ async def clear_graph(scope: str = Body(default="all", embed=True)):
         raise HTTPException(
             status_code=500, 
             detail=f"Failed to clear graph data: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+@root_router.post("/clear")
+async def root_clear_graph(payload: Dict[str, Any] = Body(default={"scope": "all"})):
+    """
+    Clear graph data (legacy response shape).
+    URL: POST /clear
+    """
+    scope = payload.get("scope", "all")
+    _validate_scope(scope)
+
+    try:
+        count = await graph_service.clear_graph(scope)
+        return {"status": "success", "message": f"Graph cleared ({scope})", "deleted_count": count}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, 
+            detail=f"Failed to clear graph data: {str(e)}"
+        )
@@ -1,96 +1,122 @@
-from fastapi import APIRouter, HTTPException, Body
-from typing import List, Dict, Any
+from fastapi import APIRouter, HTTPException, Body, Query
+from typing import List, Dict, Any, Optional
 import logging
-import traceback
+import asyncio
 
 # Import the service
 from app.services.graph_service import graph_service
+from app.db.result_cache import ResultCache, graph_version
 
 router = APIRouter(prefix="/api/documents", tags=["Documents"])
 logger = logging.getLogger(__name__)
 
+# Counts stored on each Document vertex at ingest: one row per document, no element scan.
+# -1 marks a document uploaded before counts were stored, or one a later write made stale
+# (every write that adds, removes or moves tagged elements marks it; see GraphRepository).
+DOCUMENT_STORED_COUNTS_QUERY = (
+    "g.V().has('normType', 'Document').has('documentId')"
+    ".project('documentId', 'nodeCount', 'edgeCount')"
+    ".by('documentId')"
+    ".by(coalesce(values('nodeCount'), constant(-1)))"
+    ".by(coalesce(values('edgeCount'), constant(-1)))"
+)
+
+# Stale documents recounted at once while building a listing
+STALE_RECOUNT_CONCURRENCY = 8
+
+# The document list only changes on writes; cache it per graph version for a short window
+documents_cache = ResultCache("documents", ttl=30)
+
 @router.get("")
-async def list_documents() -> List[Dict[str, Any]]:
+async def list_documents(
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=1000)
+) -> List[Dict[str, Any]]:
     """
     Fetch documents using Efficient Aggregation.
+    Optional skip/limit page through the list (ordered by documentId).
     """
     try:
-        # Access the client from the repo
-        client = graph_service.repo.client
-        if not client:
-            logger.warning("Graph client is not initialized.")
-            return []
-
-        # 1. The Aggregation Query (Group by documentId)
-        query = "g.V().has('documentId').group().by('documentId').by(count())"
-        
-        # 2. Execute Safely
-        try:
-            future = client.submit_async(query)
-            if hasattr(future, 'result'):
-                result_set = future.result()       
-                result = result_set.all().result() 
-            else:
-                result = await future
-        except Exception as query_exc:
-            error_msg = str(query_exc)
-            # If 404 (NotFound), the graph is empty. Return [].
-            if "404" in error_msg or "NotFound" in error_msg:
+        cache_key = str(await graph_version.current())
+        documents = await documents_cache.get(cache_key)
+        if documents is None:
+            documents = await _load_documents()
+            if documents is None:
                 return []
-            raise query_exc
-
-        documents = []
-
-        if result:
-            # Gremlin .group() returns: [{'file.csv': 708}]
-            data_map = result[0] if isinstance(result, list) and len(result) > 0 else {}
-            
-            iterator = []
-            if isinstance(data_map, dict):
-                iterator = data_map.items()
-            elif hasattr(data_map, 'items'):
-                 iterator = data_map.items()
-
-            for doc_id_key, count_val in iterator:
-                raw_name = str(doc_id_key)
-                
-                # --- FORMATTING ---
-                display_filename = raw_name
-                
-                # Remove extension for the "Display Name" only (Title)
-                if '.' in display_filename:
-                    display_filename = display_filename.rsplit('.', 1)[0]
-                
-                # Pretty Print Title (e.g. "car_insurance" -> "Car Insurance")
-                display_filename = display_filename.replace("_", " ").replace("-", " ").title()
-                
-                # --- BUILD RESPONSE ---
-                documents.append({
-                    "id": raw_name,
-                    "documentId": raw_name,
-                    "filename": raw_name, 
-                    "displayName": display_filename,
-                    "entityCount": count_val,
-                    "type": "file"
-                })
-
-        return documents
+            await documents_cache.set(cache_key, documents)
+
+        end = skip + limit if limit else None
+        return documents[skip:end]
 
     except Exception as e:
-        logger.error(f"Error listing documents: {e}")
-        traceback.print_exc()
+        logger.exception("Error listing documents: %s", e)
         return []
 
+async def _submit(query: str, bindings: Optional[Dict[str, Any]] = None) -> List[Any]:
+    """
+    Runs one query through the repository's shared path: awaited futures (no event-loop
+    blocking), 429 retries honouring Cosmos' retry-after, and a 404 (empty graph) as [].
+    """
+    return await graph_service.repo._execute_query(query, bindings) or []
+
+def _display_name(raw_name: str) -> str:
+    # Remove extension for the "Display Name" only (Title)
+    display_filename = raw_name.rsplit('.', 1)[0] if '.' in raw_name else raw_name
+    # Pretty Print Title (e.g. "car_insurance" -> "Car Insurance")
+    return display_filename.replace("_", " ").replace("-", " ").title()
+
+async def _load_documents() -> Optional[List[Dict[str, Any]]]:
+    """Reads one entry per Document vertex, recounting only the stale ones (None if the client is down)."""
+    # Access the client from the repo
+    client = graph_service.repo.client
+    if not client:
+        logger.warning("Graph client is not initialized.")
+        return None
+
+    # 1. Stored counts, with live per-document counts for rows marked stale
+    stored = await _submit(DOCUMENT_STORED_COUNTS_QUERY)
+    entity_counts = {row["documentId"]: row["nodeCount"] for row in stored}
+    edge_counts = {row["documentId"]: row["edgeCount"] for row in stored}
+
+    stale = [doc_id for doc_id in entity_counts if entity_counts[doc_id] < 0 or edge_counts[doc_id] < 0]
+    semaphore = asyncio.Semaphore(STALE_RECOUNT_CONCURRENCY)
+
+    async def recount(doc_id: str):
+        async with semaphore:
+            entity_counts[doc_id], edge_counts[doc_id] = await graph_service.repo.count_document(doc_id)
+
+    await asyncio.gather(*(recount(doc_id) for doc_id in stale))
+
+    # 2. Build Response (server already returned scalar counts)
+    documents = [
+        {
+            "id": str(doc_id),
+            "documentId": str(doc_id),
+            "filename": str(doc_id), 
+            "displayName": _display_name(str(doc_id)),
+            "entityCount": count_val,
+            "relationshipCount": edge_counts.get(doc_id, 0),
+            "type": "file"
+        }
+        for doc_id, count_val in entity_counts.items()
+    ]
+
+    # Stable order so skip/limit pages are consistent
+    documents.sort(key=lambda d: d["documentId"])
+    return documents
+
 @router.delete("")
-async def delete_document(payload: Dict[str, Any] = Body(...)):
+async def delete_document(payload: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
     filename = payload.get("filename")
     if not filename:
         raise HTTPException(status_code=400, detail="Filename required")
     try:
         # --- FIX: Do NOT strip extension ---
         logger.info(f"Requesting deletion for documentId: {filename}")
-        await graph_service.repo.delete_data_by_filename(filename)
-        return {"status": "success", "deleted": filename}
+        # Single server-side entry point: bound batch drops of has('documentId', fid),
+        # which include the Document vertex itself (it carries its own documentId)
+        removed = await graph_service.delete_document_data(filename)
+        return {"status": "success", "deleted": filename, "nodesRemoved": removed}
     except Exception as e:
         logger.error(f"Error deleting document: {e}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
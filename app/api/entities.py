@@ -1,21 +1,23 @@
 from fastapi import APIRouter, Query, HTTPException
-from typing import Optional
+from typing import Optional, List, Dict, Any
+import logging
 
 from app.services.graph_service import graph_service
 
-router = APIRouter(prefix="/api/entities", tags=["Entities"])
+# Remove inner prefix so main.py controls the URL (e.g., GET /api/entities/)
+router = APIRouter(tags=["Entities"])
+logger = logging.getLogger(__name__)
 
 @router.get("/")
 async def list_entities(
     label: Optional[str] = Query(default=None, description="Filter by entity label"),
-):
+) -> List[Dict[str, Any]]:
     """
     Read-only endpoint to list entities.
-    Updated to support async execution to prevent 500 errors.
+    The label filter runs server-side (bound hasLabel), so only matching vertices come back.
     """
     try:
-        # Added 'await' here because the service method is now async
-        entities = await graph_service.get_entities(label=label)
-        return entities
+        return await graph_service.get_entities(label=label)
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error fetching entities: {str(e)}")
\ No newline at end of file
+        logger.exception("Error fetching entities: %s", e)
+        raise HTTPException(status_code=500, detail=f"Error fetching entities: {str(e)}")
@@ -1,7 +1,13 @@
 import uuid
+import base64
+import hashlib
+import asyncio
+import itertools
 import logging
+import orjson
 from fastapi import APIRouter, HTTPException, Body
-from pydantic import BaseModel, Field
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, model_validator
 from typing import Dict, Any, List, Optional, Literal
 
 # Import Configuration
@@ -9,11 +15,49 @@ from app.config import settings
 
 # Import Services
 from app.services.graph_service import graph_service
+from app.db.result_cache import ResultCache, graph_version
+from app.utils.cache import TTLCache
 # Note: graph_analytics import removed as it was only used by the deleted analyze endpoint
 
 router = APIRouter(prefix="/api/graph", tags=["Graph"])
 logger = logging.getLogger(__name__)
 
+# /fetch logs one request in this many (per process); the rest skip logging entirely
+FETCH_LOG_SAMPLE_EVERY = 100
+_fetch_calls = itertools.count()
+
+# Dashboards poll /fetch with identical payloads; reuse a result briefly within one graph version
+fetch_cache = ResultCache("fetch", ttl=10, maxsize=256)
+
+# Shorter /search queries match most of the graph (a full scan per keystroke): answer them empty
+SEARCH_MIN_QUERY_LENGTH = 3
+# Type-ahead repeats the same prefixes; results are reused until the next graph write
+search_cache = ResultCache("search", ttl=300)
+
+# Updates/deletes from one /entity/batch call in flight at once (bounded to stay inside provisioned RU)
+ENTITY_BATCH_CONCURRENCY = 10
+
+# entity_id -> (graph version after our last update, digest of what it wrote). UI autosave resends
+# unchanged entities; if nothing at all was written since, the update is skipped. Only with the
+# Redis-shared version: a per-process one cannot see another worker's write to the same vertex.
+_entity_saves = TTLCache(maxsize=4096, ttl=3600)
+
+# Partition key property name from .env (default 'pk'), resolved once instead of per request
+PK_NAME = getattr(settings, "COSMOS_GREMLIN_PARTITION_KEY", "pk")
+
+# Frontend aliases accepted for relationship endpoints, in priority order
+_SRC_KEYS = ("source", "from")
+_TGT_KEYS = ("target", "to")
+_LBL_KEYS = ("label", "type")
+
+def _first(data: Dict[str, Any], keys: tuple, default: Any = None) -> Any:
+    """First truthy value among alias keys (same semantics as chained `or`)."""
+    for key in keys:
+        value = data.get(key)
+        if value:
+            return value
+    return default
+
 # ==========================================
 # 0. DATA MODELS
 # ==========================================
@@ -23,10 +67,33 @@ class FetchPayload(BaseModel):
     filters: Dict[str, Any] = {}
     documentId: Optional[str] = None
     document_id: Optional[str] = None
+    # NDJSON stream ({"type": "node"|"edge", "data": ...} per line) instead of one {nodes, edges} body
+    stream: bool = False
+    # Start a paged walk of the whole graph: the response carries a 'next_cursor' (unpaged fetches are unsorted)
+    paged: bool = False
+    # Opaque 'next_cursor' from the previous /fetch page (whole-graph fetches only; implies paged)
+    cursor: Optional[str] = None
+    # Property keys to return (e.g. ["name", "normType"]); None returns every property.
+    # Full records can then be loaded per node via GET /api/graph/entity/{id}.
+    fields: Optional[List[str]] = None
+
+    @model_validator(mode="before")
+    @classmethod
+    def _merge_document_id(cls, values: Any) -> Any:
+        """UI callers send the document as documentId, document_id or filters.document_id: resolve it once, here."""
+        if isinstance(values, dict) and not values.get("documentId"):
+            filters = values.get("filters")
+            doc_id = values.get("document_id") or (filters.get("document_id") if isinstance(filters, dict) else None)
+            if doc_id:
+                values = {**values, "documentId": doc_id}
+        return values
 
 class SearchPayload(BaseModel):
     query: str
 
+class NeighborRequest(BaseModel):
+    nodeId: str
+
 class EntityPayload(BaseModel):
     action: Literal["create", "update", "delete"] = Field(..., description="Action to perform")
     data: Dict[str, Any] = Field(..., description="Entity data (id, label, properties)")
@@ -70,38 +137,80 @@ class RelationshipPayload(BaseModel):
             }
         }
 
+    @model_validator(mode="before")
+    @classmethod
+    def _resolve_aliases(cls, values: Any) -> Any:
+        """Creates accept source/from, target/to, label/type: map them onto source/target/label once, at parse time."""
+        if not isinstance(values, dict) or values.get("action") != "create" or not isinstance(values.get("data"), dict):
+            return values
+        data = dict(values["data"])
+        for canonical, keys in (("source", _SRC_KEYS), ("target", _TGT_KEYS), ("label", _LBL_KEYS)):
+            value = _first(data, keys)
+            if value:
+                data[canonical] = value
+        return {**values, "data": data}
+
+class EntityBatchPayload(BaseModel):
+    actions: List[EntityPayload] = Field(..., description="Entity actions, applied as one batch")
+
 class DocumentPayload(BaseModel):
     filename: str
 
+class GraphStats(BaseModel):
+    nodes: int = 0
+    edges: int = 0
+
 # ==========================================
 # 1. FETCH & SEARCH OPERATIONS
 # ==========================================
 
 @router.post("/fetch")
-async def fetch_graph(payload: FetchPayload):
+async def fetch_graph(payload: FetchPayload) -> Dict[str, Any]:
     """
     Loads combined nodes and edges for the frontend map.
     Robustly reads 'documentId' from root, snake_case field, or nested filters.
+    Whole-graph fetches with 'paged' are paged by id: pass the returned 'next_cursor' back as 'cursor' for the next page.
     """
+    after = _decode_cursor(payload.cursor) if payload.cursor else None
     try:
         # Check all possible locations for document_id to support various UI calls
-        doc_id = (
-            payload.documentId or 
-            payload.document_id or 
-            payload.filters.get("document_id")
-        )
+        # Resolved from document_id / filters.document_id at parse time (FetchPayload validator)
+        doc_id = payload.documentId
         
-        if doc_id:
-            logger.info(f"Fetching graph for specific document: {doc_id}")
-        else:
-            logger.info(f"Fetching entire graph (Limit: {payload.limit})")
+        # Hottest route: log a 1-in-N sample, lazily formatted, as key=value pairs
+        if next(_fetch_calls) % FETCH_LOG_SAMPLE_EVERY == 0 and logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "fetch_graph document_id=%s limit=%d stream=%s fields=%s sample=1/%d",
+                doc_id, payload.limit, payload.stream, payload.fields, FETCH_LOG_SAMPLE_EVERY
+            )
+
+        if payload.stream:
+            return StreamingResponse(
+                _ndjson_graph(payload.limit, payload.filters.get("types"), doc_id, payload.fields),
+                media_type="application/x-ndjson"
+            )
+
+        types = payload.filters.get("types")
+        cache_key = _fetch_cache_key(
+            await graph_version.current(), doc_id, payload.limit, types, payload.cursor, payload.fields, payload.paged
+        )
+        result = await fetch_cache.get(cache_key)
+        if result is not None:
+            return result
 
         # Execute query via repository
         result = await graph_service.repo.fetch_combined_graph(
             limit=payload.limit,
-            types=payload.filters.get("types"),
-            document_id=doc_id
+            types=types,
+            document_id=doc_id,
+            after=after,
+            fields=payload.fields,
+            paged=payload.paged
         )
+        result["next_cursor"] = _encode_cursor(result.pop("next", None))
+        # A failed read comes back as an empty graph with "error": never cache that
+        if "error" not in result:
+            await fetch_cache.set(cache_key, result)
         return result
 
     except Exception as e:
@@ -110,21 +219,67 @@ async def fetch_graph(payload: FetchPayload):
         return {"nodes": [], "edges": [], "meta": {"count": {"nodes": 0, "edges": 0}}}
 
 
+def _fetch_cache_key(version: int, doc_id: Optional[str], limit: int, types: Optional[List[str]],
+                     cursor: Optional[str], fields: Optional[List[str]], paged: bool) -> str:
+    """Everything that shapes a /fetch response; the graph version makes any write a miss."""
+    return orjson.dumps([version, doc_id, limit, types, cursor, fields, paged]).decode()
+
+def _encode_cursor(next_page: Optional[Dict[str, Any]]) -> Optional[str]:
+    return base64.urlsafe_b64encode(orjson.dumps(next_page)).decode() if next_page else None
+
+def _decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        after = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, orjson.JSONDecodeError):
+        after = None
+    if not isinstance(after, dict):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return after
+
+
+async def _ndjson_graph(limit: int, types: Optional[List[str]], doc_id: Optional[str], fields: Optional[List[str]]):
+    """NDJSON generator for /fetch with stream=True: one line per node, then one per edge."""
+    try:
+        async for kind, rows in graph_service.repo.fetch_combined_graph_stream(
+            limit=limit, types=types, document_id=doc_id, fields=fields
+        ):
+            for row in rows:
+                yield orjson.dumps({"type": kind, "data": row}, default=str) + b"\n"
+    except Exception as e:
+        logger.error(f"Fetch Graph Stream Error: {e}")
+        yield orjson.dumps({"type": "error", "error": str(e)}) + b"\n"
+
+
 @router.post("/search")
-async def search_graph(payload: SearchPayload):
+async def search_graph(payload: SearchPayload) -> Dict[str, Any]:
     """Highlights specific nodes using a keyword search."""
     try:
-        if not payload.query:
+        query = payload.query.strip()
+        if len(query) < SEARCH_MIN_QUERY_LENGTH:
             return {"results": [], "count": 0}
-        
-        results = await graph_service.search_nodes(payload.query)
+
+        cache_key = f"{await graph_version.current()}:{query.lower()}"
+        results = await search_cache.get(cache_key)
+        if results is None:
+            results = await graph_service.search_nodes(query)
+            await search_cache.set(cache_key, results)
         return {"results": results, "count": len(results)}
     except Exception as e:
         logger.error(f"Search Error: {e}")
         return {"results": [], "count": 0, "error": str(e)}
 
 
-@router.get("/stats")
+@router.post("/neighbors")
+async def get_node_neighbors(request: NeighborRequest) -> Dict[str, Any]:
+    """Central node plus its direct neighbours and connecting edges (graph exploration clicks)."""
+    try:
+        return await graph_service.get_neighbors(request.nodeId)
+    except Exception as e:
+        logger.error(f"Error in neighbor fetch: {str(e)}")
+        return {"nodes": [], "edges": []}
+
+
+@router.get("/stats", response_model=GraphStats)
 async def graph_stats():
     """Returns total count of nodes and edges."""
     try:
@@ -138,89 +293,127 @@ async def graph_stats():
 # 2. ENTITY (NODE) MANAGEMENT
 # ==========================================
 
+def _prepare_entity_create(payload: EntityPayload) -> Dict[str, Any]:
+    """Fills id, partition key and document tag on a create payload's data (normType is derived in add_entities)."""
+    data = payload.data
+
+    # 1. Robust ID Generation: Prevent 500 errors on missing IDs
+    if "id" not in data or not data["id"]:
+        data["id"] = str(uuid.uuid4())
+
+    # 2. Prepare Properties (data was just parsed from this request's JSON: safe to edit in place)
+    properties = data.setdefault("properties", {})
+    
+    # --- DYNAMIC PARTITION KEY ---
+    # If the partition key is missing in properties, force it to match ID.
+    if PK_NAME not in properties:
+        properties[PK_NAME] = data["id"]
+
+    # 3. Auto-Tagging for Visibility
+    if payload.documentId and "documentId" not in properties:
+        properties["documentId"] = payload.documentId
+
+    # Ensure Partition Key is also at the root level if the service layer checks there
+    data[PK_NAME] = properties[PK_NAME] 
+    return data
+
+def _require_entity_id(payload: EntityPayload) -> str:
+    entity_id = payload.data.get("id")
+    if not entity_id:
+        raise HTTPException(status_code=400, detail=f"Entity ID is required for {payload.action}")
+    return entity_id
+
+async def _update_entity(payload: EntityPayload) -> bool:
+    """Applies an update; False if it was skipped as identical to our last write of this entity."""
+    data = payload.data
+    entity_id = _require_entity_id(payload)
+    
+    # FIXED: Get Partition Key for Update
+    # Try getting it from data root, or properties, or default to ID
+    partition_key = data.get(PK_NAME) or data.get("partitionKey") or entity_id
+
+    # Persist type change if user edited it
+    properties = data.setdefault("properties", {})
+    node_type = data.get("type") or properties.get("type")
+    if node_type:
+        properties["normType"] = node_type
+    
+    digest = hashlib.blake2b(
+        orjson.dumps([partition_key, properties], option=orjson.OPT_SORT_KEYS, default=str), digest_size=16
+    ).digest()
+    version = await graph_version.shared()
+    if version is not None and _entity_saves.get(entity_id) == (version, digest):
+        return False
+
+    # Pass partition_key to service; record the version this write produced, not a later re-read
+    # (another worker's write landing in between would otherwise be taken as ours)
+    # 'type' is the vertex label as /fetch reported it (see _clean_vertex): a rename composes searchKey with it
+    version = await graph_service.update_entity(entity_id, properties, partition_key, label=node_type)
+    if version is not None:
+        _entity_saves.set(entity_id, (version, digest))
+    return True
+
+def _delete_key(payload: EntityPayload) -> tuple:
+    """(entity_id, partition_key) for a delete action."""
+    data = payload.data
+    entity_id = _require_entity_id(payload)
+    
+    # FIXED: Get Partition Key for Delete
+    return entity_id, data.get(PK_NAME) or data.get("partitionKey") or entity_id
+
+async def _delete_entity(payload: EntityPayload) -> None:
+    entity_id, partition_key = _delete_key(payload)
+    
+    # Pass partition_key to service
+    await graph_service.delete_entity(entity_id, partition_key)
+    _entity_saves.pop(entity_id, None)
+
+@router.get("/entity/{entity_id}")
+async def get_entity(entity_id: str) -> Dict[str, Any]:
+    """Full properties of one node, for hydrating a node picked from a lean (fields=...) /fetch."""
+    try:
+        entity = await graph_service.repo.get_entity(entity_id)
+    except Exception as e:
+        logger.error(f"Entity Fetch Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if entity is None:
+        raise HTTPException(status_code=404, detail=f"Entity {entity_id} not found")
+    return entity
+
+
 @router.post("/entity")
-async def entity_crud(payload: EntityPayload):
+async def entity_crud(payload: EntityPayload) -> Dict[str, Any]:
     """
     Unified controller for adding, updating, or deleting nodes.
     Dynamically handles Partition Keys based on environment configuration.
     """
     try:
         action = payload.action
-        data = payload.data
         
-        # Retrieve the specific key name from .env (default to 'pk')
-        pk_name = getattr(settings, "COSMOS_GREMLIN_PARTITION_KEY", "pk")
 
         # --- CREATE ---
         if action == "create":
-            # 1. Robust ID Generation: Prevent 500 errors on missing IDs
-            if "id" not in data or not data["id"]:
-                data["id"] = str(uuid.uuid4())
-
-            # 2. Prepare Properties
-            properties = data.get("properties", {}).copy()
-            
-            # --- DYNAMIC PARTITION KEY ---
-            # If the partition key is missing in properties, force it to match ID.
-            if pk_name not in properties:
-                properties[pk_name] = data["id"]
-
-            # 3. Auto-Tagging for Visibility
-            if payload.documentId and "documentId" not in properties:
-                properties["documentId"] = payload.documentId
-
-            # 4. Type Normalization (UI 'type' -> DB 'normType')
-            node_type = data.get("type") or properties.get("type")
-            if node_type:
-                properties["normType"] = node_type
-            
-            # Apply cleaned properties back to data object
-            data["properties"] = properties
-            
-            # Ensure Partition Key is also at the root level if the service layer checks there
-            data[pk_name] = properties[pk_name] 
-            
-            await graph_service.add_entities([data])
+            data = _prepare_entity_create(payload)
+            # The vertex id is derived from type + name in add_entities, not taken from the payload
+            [entity_id] = await graph_service.add_entities([data])
             
             return {
                 "status": "success", 
                 "message": "Entity created successfully",
-                "id": data["id"],
-                "partitionKey": pk_name 
+                "id": entity_id,
+                "partitionKey": PK_NAME 
             }
         
         # --- UPDATE ---
         elif action == "update":
-            entity_id = data.get("id")
-            if not entity_id:
-                raise HTTPException(status_code=400, detail="Entity ID is required for update")
-            
-            # FIXED: Get Partition Key for Update
-            # Try getting it from data root, or properties, or default to ID
-            partition_key = data.get(pk_name) or data.get("partitionKey") or entity_id
-
-            # Persist type change if user edited it
-            properties = data.get("properties", {}).copy()
-            node_type = data.get("type") or properties.get("type")
-            if node_type:
-                properties["normType"] = node_type
-            
-            # Pass partition_key to service
-            await graph_service.update_entity(entity_id, properties, partition_key)
+            if not await _update_entity(payload):
+                return {"status": "noop", "message": "Entity unchanged"}
             return {"status": "success", "message": "Entity updated successfully"}
         
         # --- DELETE ---
         elif action == "delete":
-            entity_id = data.get("id")
-            if not entity_id:
-                raise HTTPException(status_code=400, detail="Entity ID is required for delete")
-            
-            # FIXED: Get Partition Key for Delete
-            partition_key = data.get(pk_name) or data.get("partitionKey") or entity_id
-            
-            # Pass partition_key to service
-            await graph_service.delete_entity(entity_id, partition_key)
-            return {"status": "success", "message": f"Entity {entity_id} deleted"}
+            await _delete_entity(payload)
+            return {"status": "success", "message": f"Entity {payload.data.get('id')} deleted"}
         
         else:
             raise HTTPException(status_code=400, detail=f"Unknown entity action: {action}")
@@ -233,12 +426,75 @@ async def entity_crud(payload: EntityPayload):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/entity/batch")
+async def entity_crud_batch(payload: EntityBatchPayload) -> Dict[str, Any]:
+    """
+    Applies many entity actions in one request (e.g. a bulk import from the UI).
+    Every action is validated before any write; creates go through one add_entities call,
+    updates run concurrently (at most ENTITY_BATCH_CONCURRENCY at a time) and deletes are dropped
+    together per partition (graph_service.delete_entities).
+    Counts report writes actually performed: skipped (unchanged) updates and failed actions are left out,
+    and failures are listed individually instead of aborting the rest of the batch.
+    """
+    try:
+        for item in payload.actions:
+            if item.action != "create":
+                _require_entity_id(item)
+
+        creates = [_prepare_entity_create(item) for item in payload.actions if item.action == "create"]
+        # Vertex ids are derived in add_entities; repeats of one entity are written once
+        created = list(dict.fromkeys(await graph_service.add_entities(creates))) if creates else []
+
+        semaphore = asyncio.Semaphore(ENTITY_BATCH_CONCURRENCY)
+
+        async def apply(item: EntityPayload) -> bool:
+            """True if a write was performed."""
+            async with semaphore:
+                return await _update_entity(item)
+
+        async def delete_all(keys: List[tuple]) -> bool:
+            if keys:
+                await graph_service.delete_entities(keys)
+                for entity_id, _ in keys:
+                    _entity_saves.pop(entity_id, None)
+            return True
+
+        updates = [item for item in payload.actions if item.action == "update"]
+        deletes = [item for item in payload.actions if item.action == "delete"]
+        *outcomes, deleted = await asyncio.gather(
+            *(apply(item) for item in updates),
+            delete_all(list(dict.fromkeys(_delete_key(item) for item in deletes))),
+            return_exceptions=True
+        )
+
+        failed = []
+        for item, outcome in [*zip(updates, outcomes), *((item, deleted) for item in deletes)]:
+            if isinstance(outcome, Exception):
+                logger.error(f"Entity Batch {item.action} failed for {item.data.get('id')}: {outcome}")
+                failed.append({"id": item.data.get("id"), "action": item.action, "error": str(outcome)})
+
+        return {
+            "status": "partial" if failed else "success",
+            "created": created,
+            "updated": sum(1 for outcome in outcomes if outcome is True),
+            "deleted": len(deletes) if deleted is True else 0,
+            "failed": failed,
+            "partitionKey": PK_NAME
+        }
+
+    except HTTPException as http_ex:
+        raise http_ex
+    except Exception as e:
+        logger.error(f"Entity Batch Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 # ==========================================
 # 3. RELATIONSHIP (EDGE) MANAGEMENT
 # ==========================================
 
 @router.post("/relationship")
-async def relationship_crud(payload: RelationshipPayload):
+async def relationship_crud(payload: RelationshipPayload) -> Dict[str, Any]:
     """Unified controller for creating/updating/deleting edges."""
     try:
         action = payload.action
@@ -247,9 +503,10 @@ async def relationship_crud(payload: RelationshipPayload):
         # --- CREATE ---
         if action == "create":
             # Handle aliases (source/from, target/to, label/type) for frontend compatibility
-            source_id = data.get("source") or data.get("from")
-            target_id = data.get("target") or data.get("to")
-            rel_label = data.get("label") or data.get("type") or "related_to"
+            # Aliases were resolved at parse time (RelationshipPayload validator)
+            source_id = data.get("source")
+            target_id = data.get("target")
+            rel_label = data.get("label") or "related_to"
 
             if not source_id or not target_id:
                 raise HTTPException(status_code=400, detail="Source and Target IDs are required")
@@ -303,7 +560,7 @@ async def relationship_crud(payload: RelationshipPayload):
 # ==========================================
 
 @router.post("/document")
-async def delete_document_data(payload: DocumentPayload):
+async def delete_document_data(payload: DocumentPayload) -> Dict[str, Any]:
     """Deletes all nodes and edges associated with a specific file."""
     try:
         filename = payload.filename
@@ -318,6 +575,8 @@ async def delete_document_data(payload: DocumentPayload):
             "filename": filename, 
             "nodes_removed": count
         }
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Document Delete Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
@@ -52,12 +52,10 @@ async def process_document(
 
             logger.info("Received file for processing: %s", file.filename)
 
-            # 1. Read file content (This IS async in FastAPI)
-            content = await file.read()
-            
-            # 2. Call the processor (Updated to await because processor is now async)
+            # Hand over the spooled upload itself: CSVs are parsed straight from it,
+            # without first copying the whole file into bytes and then into a str
             # Ensure document_processor.process_file returns a dict with 'entities' and 'relationships' counts
-            result = await document_processor.process_file(content, file.filename)
+            result = await document_processor.process_file(file.file, file.filename)
 
         # ---- Text processing ----
         else:
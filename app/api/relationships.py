@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Query, HTTPException
 from app.services.graph_service import graph_service
 import logging
+from typing import List, Dict, Any
 
 router = APIRouter(prefix="/api/relationships", tags=["Relationships"])
 logger = logging.getLogger(__name__)
@@ -8,7 +9,7 @@ logger = logging.getLogger(__name__)
 @router.get("/")
 async def list_relationships(
     entity_id: str = Query(..., description="Entity ID to fetch relationships for"),
-):
+) -> List[Dict[str, Any]]:
     """
     Read-only endpoint to fetch relationships for an entity.
     If the entity has been analyzed, edges will contain 'riskCategory' (Cause/Effect).
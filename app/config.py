@@ -1,4 +1,5 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
+from typing import Optional
 from pydantic import Field, ValidationError
 
 
@@ -61,6 +62,35 @@ class Settings(BaseSettings):
         description="Cosmos DB Gremlin primary key"
     )
 
+    COSMOS_GREMLIN_POOL_SIZE: Optional[int] = Field(
+        default=None,
+        description="Number of pooled Gremlin websocket connections (and driver worker threads); unset = max(8, 4 x CPUs)"
+    )
+
+    COSMOS_GREMLIN_MAX_WORKERS: Optional[int] = Field(
+        default=None,
+        description="Driver worker threads; extra threads let requests queue for a free connection (unset = pool size)"
+    )
+
+    COSMOS_GREMLIN_MIN_POOL_SIZE: int = Field(
+        default=2,
+        description="Pooled connections authenticated at startup so the first requests skip the warmup (0 disables)"
+    )
+
+    COSMOS_GREMLIN_KEEPALIVE_SECONDS: int = Field(
+        default=30,
+        description="Interval between keepalive pings so Cosmos does not close idle connections (0 disables)"
+    )
+
+    # =========================
+    # Shared Cache (optional)
+    # =========================
+
+    REDIS_URL: Optional[str] = Field(
+        default=None,
+        description="Redis URL for the cross-worker result cache, e.g. rediss://:key@host:6380/0 (unset = in-process cache)"
+    )
+
     # =========================
     # Application Environment
     # =========================
@@ -70,6 +100,11 @@ class Settings(BaseSettings):
         description="Application environment: development | staging | production"
     )
 
+    FORCE_AI: bool = Field(
+        default=False,
+        description="Debug override: send even risk-free ('Stable') nodes to the LLM in /analyze"
+    )
+
     model_config = SettingsConfigDict(
         env_file=".env",              # load from .env file
         env_file_encoding="utf-8",
@@ -0,0 +1,47 @@
+import logging
+from typing import Optional
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_redis_client = None
+_redis_disabled = False
+
+
+def get_redis_client() -> Optional["redis.asyncio.Redis"]:
+    """
+    Returns a singleton async Redis client, or None when REDIS_URL is not set
+    (callers then fall back to their in-process caches).
+    """
+    global _redis_client, _redis_disabled
+
+    if _redis_client or _redis_disabled:
+        return _redis_client
+
+    if not settings.REDIS_URL:
+        _redis_disabled = True
+        return None
+
+    try:
+        import redis.asyncio as redis
+
+        _redis_client = redis.from_url(settings.REDIS_URL, health_check_interval=30)
+        logger.info("Redis client initialized for shared result cache")
+    except Exception as exc:
+        logger.error(f"Redis unavailable, using in-process cache: {exc}")
+        _redis_disabled = True
+
+    return _redis_client
+
+
+async def close_redis_client():
+    """
+    Close the Redis client cleanly (useful on app shutdown).
+    """
+    global _redis_client
+
+    if _redis_client:
+        await _redis_client.aclose()
+        _redis_client = None
+        logger.info("Redis client closed")
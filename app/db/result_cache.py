@@ -0,0 +1,132 @@
+import asyncio
+import logging
+from typing import Any, Optional
+
+import orjson
+
+from app.db.redis_client import get_redis_client
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+GRAPH_VERSION_KEY = "kg:graph_version"
+
+
+class GraphVersion:
+    """
+    Monotonic counter bumped by every graph write.
+    Cache keys embed it, so one write invalidates all derived results at once.
+    Shared through Redis when configured, otherwise per process.
+    """
+
+    def __init__(self):
+        self._local = 0
+
+    async def current(self) -> int:
+        shared = await self.shared()
+        return self._local if shared is None else shared
+
+    async def shared(self) -> Optional[int]:
+        """The cross-worker version from Redis, or None when it is not available (per-process only)."""
+        redis = get_redis_client()
+        if redis:
+            try:
+                value = await redis.get(GRAPH_VERSION_KEY)
+                return int(value or 0)
+            except Exception as exc:
+                logger.warning(f"Graph version read failed: {exc}")
+        return None
+
+    async def bump(self) -> Optional[int]:
+        """
+        Moves the version past this write. Returns the shared version it produced (Redis INCR),
+        or None when only the per-process counter moved (same contract as shared()).
+        """
+        self._local += 1
+        redis = get_redis_client()
+        if redis:
+            try:
+                return await redis.incr(GRAPH_VERSION_KEY)
+            except Exception as exc:
+                logger.warning(f"Graph version bump failed: {exc}")
+        return None
+
+
+class ResultCache:
+    """
+    JSON result cache shared by all workers (Redis), fronted by an in-process TTL layer
+    that also serves as the fallback when Redis is not configured.
+    Values must be orjson-serializable; keys should embed the graph version.
+    """
+
+    def __init__(self, namespace: str, ttl: int = 3600, maxsize: int = 10_000):
+        self.namespace = namespace
+        self.ttl = ttl
+        self._local = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def _key(self, key: str) -> str:
+        return f"kg:{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        # In-process first: keys embed the graph version, so a local hit is never stale
+        # and saves the Redis round trip on repeat reads (dashboard polling).
+        value = self._local.get(key)
+        if value is not None:
+            return value
+
+        redis = get_redis_client()
+        if redis:
+            try:
+                raw = await redis.get(self._key(key))
+                if raw is not None:
+                    value = orjson.loads(raw)
+                    self._local.set(key, value)
+                    return value
+            except Exception as exc:
+                logger.warning(f"Result cache read failed ({self.namespace}): {exc}")
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        self._local.set(key, value)
+        redis = get_redis_client()
+        if redis:
+            try:
+                await redis.set(self._key(key), orjson.dumps(value), ex=self.ttl)
+            except Exception as exc:
+                logger.warning(f"Result cache write failed ({self.namespace}): {exc}")
+
+    async def acquire_fill_lock(self, key: str, ttl: int = 30) -> bool:
+        """
+        Cross-worker stampede guard (Redis SET NX): True if this worker should compute 'key'.
+        Always True without Redis, since in-process callers are already deduplicated.
+        """
+        redis = get_redis_client()
+        if not redis:
+            return True
+        try:
+            return bool(await redis.set(self._key(f"lock:{key}"), 1, nx=True, ex=ttl))
+        except Exception as exc:
+            logger.warning(f"Result cache lock failed ({self.namespace}): {exc}")
+            return True
+
+    async def release_fill_lock(self, key: str) -> None:
+        redis = get_redis_client()
+        if redis:
+            try:
+                await redis.delete(self._key(f"lock:{key}"))
+            except Exception as exc:
+                logger.warning(f"Result cache unlock failed ({self.namespace}): {exc}")
+
+    async def wait_for(self, key: str, timeout: float, interval: float = 0.25) -> Optional[Any]:
+        """Polls for a value another worker is filling; None if it does not appear in time."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            await asyncio.sleep(interval)
+            value = await self.get(key)
+            if value is not None:
+                return value
+        return None
+
+
+graph_version = GraphVersion()
@@ -1,21 +1,16 @@
+import atexit
 import logging
-import nest_asyncio
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Body, HTTPException
+from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
-from typing import Dict, Any
-from pydantic import BaseModel
 
-# Apply nest_asyncio to prevent event loop errors
-nest_asyncio.apply()
-
-# Load environment variables
-load_dotenv()
-
-from app.services.graph_service import graph_service
+# Settings come from app.config (pydantic-settings reads .env itself): nothing to load at import
 from app.repositories.graph_repository import graph_repository
-from app.api import health, process, clear, entities, relationships, graph, documents, search, analysis
+from app.db.redis_client import close_redis_client
+from app.services import openai_extractor
+from app.api import health, process, clear, entities, relationships, graph, documents, analysis
 
 # ==========================================
 # CLEAN LOGGING CONFIGURATION
@@ -24,6 +19,16 @@ logging.basicConfig(
     level=logging.INFO,
     format="%(levelname)s:%(name)s:%(message)s"
 )
+
+# Request handlers only enqueue records; a background thread does the stream writes,
+# so the event loop never waits on the stdout lock/flush.
+_log_queue = queue.SimpleQueue()
+_root_logger = logging.getLogger()
+_log_listener = QueueListener(_log_queue, *_root_logger.handlers, respect_handler_level=True)
+_root_logger.handlers = [QueueHandler(_log_queue)]
+_log_listener.start()
+atexit.register(_log_listener.stop)
+
 logger = logging.getLogger(__name__)
 
 # 1. Silence noisy Azure/OpenAI HTTP requests
@@ -41,9 +46,14 @@ logging.getLogger("uvicorn.access").addFilter(HealthCheckFilter())
 async def lifespan(app: FastAPI):
     logger.info("Starting up... Connecting to Cosmos DB Gremlin API")
     await graph_repository.connect()
+    # The one pooled repository every router shares (graph_service, analytics, documents, ...)
+    app.state.graph_repository = graph_repository
     yield
     logger.info("Shutting down... Closing connections")
     await graph_repository.close()
+    await analysis.close_ai_client()
+    await openai_extractor.close_client()
+    await close_redis_client()
 
 def create_app() -> FastAPI:
     app = FastAPI(
@@ -74,25 +84,15 @@ def create_app() -> FastAPI:
     app.include_router(health.router, prefix="/api/health", tags=["Health"])
     app.include_router(process.router, prefix="/api/process", tags=["Process"])
     app.include_router(clear.router, prefix="/api/clear", tags=["Admin"]) 
-    app.include_router(entities.router, prefix="/entities", tags=["Entities"])
+    app.include_router(clear.root_router)
+    app.include_router(entities.router, prefix="/api/entities", tags=["Entities"])
+    # Old doubled path (/entities/api/entities/), kept for older UI builds
+    app.include_router(entities.router, prefix="/entities/api/entities", include_in_schema=False)
     app.include_router(relationships.router, prefix="/relationships", tags=["Relationships"])
     app.include_router(graph.router) 
     app.include_router(documents.router)
-    app.include_router(search.router) 
     app.include_router(analysis.router)
 
-    class NeighborRequest(BaseModel):
-        nodeId: str
-
-    @app.post("/api/graph/neighbors")
-    async def get_node_neighbors(request: NeighborRequest):
-        try:
-            data = await graph_service.get_neighbors(request.nodeId)
-            return data
-        except Exception as e:
-            logger.error(f"Error in neighbor fetch: {str(e)}")
-            return {"nodes": [], "edges": []}
-
     @app.get("/health")
     async def root_health_check():
         status = "connected" if graph_repository.client else "disconnected"
@@ -106,20 +106,10 @@ def create_app() -> FastAPI:
             "health_url": "/health"
         }
 
-    @app.post("/clear")
-    async def root_clear_graph(payload: Dict[str, Any] = Body(default={"scope": "all"})):
-        try:
-            scope = payload.get("scope", "all")
-            count = await graph_repository.clear_graph(scope)
-            return {"status": "success", "message": f"Graph cleared ({scope})", "deleted_count": count}
-        except Exception as e:
-            logger.error(f"Root clear failed: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
-
     return app
 
 app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools")
\ No newline at end of file
@@ -1,16 +1,186 @@
+import os
 import logging
 import asyncio
 import random
-from typing import List, Dict, Any, Optional
+from functools import lru_cache
+from typing import List, Dict, Any, Optional, AsyncIterator, Tuple
 
 # Core Gremlin Imports
 from gremlin_python.driver.client import Client
-from gremlin_python.driver.serializer import GraphSONSerializersV2d0
 from gremlin_python.process.traversal import TextP
 from app.config import settings 
+from app.db.result_cache import graph_version
+from app.db.graphson import OrjsonGraphSONSerializersV2d0
 
 logger = logging.getLogger(__name__)
 
+# Partition key property name (e.g. 'pk' or 'partitionKey'), resolved once
+PARTITION_KEY = getattr(settings, "COSMOS_GREMLIN_PARTITION_KEY", "pk")
+
+# --- Fixed-shape queries: built once, values passed as bindings ---
+EDGE_PROJECTION = ".project('id', 'label', 'source', 'target', 'properties').by(id).by(label).by(outV().id()).by(inV().id()).by(valueMap())"
+ENTITY_QUERY = "g.V(eid).valueMap(true)"
+ENTITIES_QUERY = "g.V().valueMap(true)"
+ENTITIES_BY_LABEL_QUERY = "g.V().hasLabel(lbl).valueMap(true)"
+RELATIONSHIPS_QUERY = "g.E()" + EDGE_PROJECTION
+ENTITY_RELATIONSHIPS_QUERY = (
+    "g.V(eid).bothE()"
+    ".project('id', 'label', 'source', 'target', 'properties', 'riskCategory')"
+    ".by(id).by(label).by(outV().id()).by(inV().id()).by(valueMap())"
+    ".by(coalesce(values('riskCategory'), constant('')))"
+)
+# Batched form of ENTITY_RELATIONSHIPS_QUERY: prefix with g.V(<id bindings>)
+ENTITIES_RELATIONSHIPS_PROJECTION = (
+    ".project('id', 'edges').by(id).by(bothE()"
+    ".project('id', 'label', 'source', 'target', 'properties', 'riskCategory')"
+    ".by(id).by(label).by(outV().id()).by(inV().id()).by(valueMap())"
+    ".by(coalesce(values('riskCategory'), constant('')))"
+    ".fold())"
+)
+DELETE_ENTITY_QUERY = f"g.V(eid).has('{PARTITION_KEY}', pkv).drop()"
+DELETE_RELATIONSHIP_QUERY = "g.E(rid).drop()"
+# Matches the lowercased name|label|id stored on each vertex at write time (see _with_search_key)
+# Only the fields a search hit shows are shipped; full properties come from get_entity on demand
+SEARCH_NODES_QUERY = (
+    "g.V().has('searchKey', TextP.containing(q)).limit(lim)"
+    ".project('id', 'type', 'name', 'normType', 'documentId')"
+    ".by(id).by(label)"
+    ".by(coalesce(values('name'), constant('')))"
+    ".by(coalesce(values('normType'), constant('')))"
+    ".by(coalesce(values('documentId'), constant('')))"
+)
+# Vertices written before searchKey existed, a page at a time, for backfill_search_keys
+MISSING_SEARCH_KEY_QUERY = (
+    f"g.V().hasNot('searchKey').limit(lim).project('id', 'label', 'pk', 'name')"
+    f".by(id).by(label).by(coalesce(values('{PARTITION_KEY}'), constant(''))).by(coalesce(values('name'), constant('')))"
+)
+SET_SEARCH_KEY_QUERY = f"g.V(eid).has('{PARTITION_KEY}', pkv).property('searchKey', sk)"
+SEARCH_KEY_BACKFILL_BATCH = 100
+DELETE_DOCUMENT_BATCH_QUERY = "g.V().has('documentId', fid).limit(batch).sideEffect(drop()).count()"
+DELETE_DOCUMENT_EDGES_QUERY = "g.E().has('doc', fid).drop()"
+VERTEX_COUNT_QUERY = "g.V().count()"
+EDGE_COUNT_QUERY = "g.E().count()"
+DOCUMENT_NODE_COUNT_QUERY = "g.V().has('documentId', fid).count()"
+DOCUMENT_EDGE_COUNT_QUERY = "g.E().has('doc', fid).count()"
+# nodeCount -1 = stale: document listings fall back to live aggregation for it
+MARK_DOCUMENT_COUNTS_STALE_QUERY = "g.V().has('documentId', within({fids})).has('normType', 'Document').property('nodeCount', -1)"
+# Stored label, for a rename whose caller did not say which label to compose searchKey with
+ENTITY_LABEL_QUERY = f"g.V(eid).has('{PARTITION_KEY}', pkv).label()"
+RELATIONSHIP_DOCUMENT_QUERY = "g.E(rid).values('doc')"
+# Documents whose counts include a vertex or its edges (dropping the vertex drops the edges too)
+ENTITY_DOCUMENTS_QUERY = (
+    f"g.V(eid).has('{PARTITION_KEY}', pkv)"
+    ".union(values('documentId'), bothE().values('doc')).dedup()"
+)
+# Other documents' edges that go along with a document's vertices when it is deleted
+DOCUMENT_LINKED_DOCUMENTS_QUERY = "g.V().has('documentId', fid).bothE().values('doc').dedup()"
+SET_DOCUMENT_COUNTS_QUERY = (
+    "g.V().has('documentId', fid).has('normType', 'Document')"
+    ".property('nodeCount', nc).property('edgeCount', ec)"
+)
+
+# Vertex upserts create_entities keeps in flight at once
+ENTITY_UPSERT_CONCURRENCY = 8
+# Edge upserts create_relationships sends per round, with a short pause between rounds (429s on big uploads)
+EDGE_UPSERT_BATCH = 10
+# Ids dropped by one delete_entities traversal (per partition)
+ENTITY_DELETE_CHUNK = 100
+
+# How often a streamed query checks for newly arrived frames while the server is still sending
+STREAM_POLL_SECONDS = 0.02
+
+def gremlin_pool_size() -> int:
+    """Configured pool size, else sized to the host: requests stay concurrent across the handlers sharing it."""
+    return settings.COSMOS_GREMLIN_POOL_SIZE or max(8, 4 * (os.cpu_count() or 1))
+
+def search_key(*parts: Any) -> str:
+    """The one lowercased string /search matches against: non-empty parts joined by '|'."""
+    return "|".join(str(part) for part in parts if part).lower()
+
+def _with_search_key(entity_id: str, label: str, properties: Dict[str, Any]) -> Dict[str, Any]:
+    """properties plus searchKey, composed the same way by every vertex write path (and the backfill)."""
+    return {**properties, "searchKey": search_key(properties.get("name"), label, entity_id)}
+
+def _scalar(value: Any) -> Any:
+    """Unwraps valueMap's single-item lists; 'type(...) is list' is the cheap exact check for the common case."""
+    return value[0] if type(value) is list and len(value) == 1 else value
+
+def _text(value: Any) -> str:
+    """str() only when needed: ids/labels from Cosmos are nearly always str already, so skip the call."""
+    return value if type(value) is str else str(value)
+
+def _clean_vertex(item: Dict[str, Any]) -> Dict[str, Any]:
+    """One valueMap(true) row -> UI node, unwrapping each property once in a single dict pass."""
+    node_id = _text(_scalar(item.get("id", "")))
+    gremlin_category = _text(_scalar(item.get("label", "Node")))
+
+    # Every key but id/label is a property (this includes the partition key)
+    properties = {key: _scalar(val) for key, val in item.items() if key != "id" and key != "label"}
+    display_name = properties.get("name") or node_id
+    properties["originalLabel"] = display_name 
+    properties["type"] = gremlin_category 
+    properties["label"] = display_name 
+
+    return {
+        "id": node_id,
+        "label": display_name,   
+        "type": gremlin_category, 
+        "properties": properties 
+    }
+
+@lru_cache(maxsize=64)
+def _combined_graph_templates(has_doc: bool, type_count: int, ordered: bool,
+                              after_node: bool, after_edge: bool, field_count: int) -> Tuple[str, str]:
+    """
+    (node_query, edge_query) text for one /fetch filter shape; values are bound by the caller
+    (did, t0.., nafter, eafter, nlim, elim, f0..). Built once per shape, not per request.
+    """
+    node_query = "g.V()"
+    edge_query = "g.E()"
+    type_filter = f".hasLabel({','.join(f't{i}' for i in range(type_count))})" if type_count else ""
+
+    if has_doc:
+        # documentId alone decides membership: a vertex retagged to this document keeps the
+        # partition it was created in, so a partition-key filter here would drop it.
+        node_query += ".has('documentId', did)" + type_filter
+        edge_query += ".has('doc', did)"
+    else:
+        # Type filter before the limit: a page is N matching nodes, and the cursor stays exact
+        node_query += type_filter
+        if after_node:
+            node_query += ".has('id', gt(nafter))"
+        if after_edge:
+            edge_query += ".has('id', gt(eafter))"
+        # The id sort is what makes a keyset cursor exact, and it costs a full sort of the matches:
+        # only paged walks pay for it, a one-shot fetch just takes the first N
+        if ordered:
+            node_query += ".order().by(id)"
+            edge_query += ".order().by(id)"
+        node_query += ".limit(nlim)"
+        edge_query += ".limit(elim)"
+
+    if field_count:
+        field_args = ",".join(f"f{i}" for i in range(field_count))
+        node_query += f".valueMap(true,{field_args})"
+        edge_query += (
+            ".project('id', 'label', 'source', 'target', 'properties')"
+            f".by(id).by(label).by(outV().id()).by(inV().id()).by(valueMap({field_args}))"
+        )
+    else:
+        node_query += ".valueMap(true)"
+        edge_query += EDGE_PROJECTION
+    return node_query, edge_query
+
+def _search_hit(row: Dict[str, Any]) -> Dict[str, Any]:
+    """A projected search row in the same node shape as _clean_vertex (properties limited to the projected ones)."""
+    node_id = _text(row["id"])
+    display_name = row["name"] or node_id
+    properties = {key: row[key] for key in ("name", "normType", "documentId") if row[key]}
+    properties["originalLabel"] = display_name
+    properties["type"] = row["type"]
+    properties["label"] = display_name
+    return {"id": node_id, "label": display_name, "type": row["type"], "properties": properties}
+
 class GraphRepository:
     def __init__(self):
         """
@@ -18,8 +188,10 @@ class GraphRepository:
         Loads the correct Partition Key name from settings to prevent 404 writes.
         """
         self.client = None 
+        self._keepalive_task: Optional[asyncio.Task] = None
+        self._connect_lock = asyncio.Lock()
         # Defines the property key used for partitioning (e.g., 'pk' or 'partitionKey')
-        self.pk_key = getattr(settings, "COSMOS_GREMLIN_PARTITION_KEY", "pk")
+        self.pk_key = PARTITION_KEY
         logger.info(f"GraphRepository initialized. Using Partition Key: '{self.pk_key}'")
 
     # ==========================================
@@ -30,6 +202,13 @@ class GraphRepository:
         if self.client:
             return
 
+        # Concurrent first requests must not each build their own pool
+        async with self._connect_lock:
+            if self.client:
+                return
+            await self._create_client()
+
+    async def _create_client(self):
         try:
             # Remove protocol and port if they exist in the env var to prevent duplication
             raw_endpoint = settings.COSMOS_GREMLIN_ENDPOINT.replace("wss://", "").replace("https://", "")
@@ -45,23 +224,68 @@ class GraphRepository:
             username = f"/dbs/{settings.COSMOS_GREMLIN_DATABASE}/colls/{container}"
             password = settings.COSMOS_GREMLIN_KEY
             
-            logger.info(f"Connecting to Cosmos DB Gremlin API at {endpoint}")
-
-            self.client = Client(
+            pool_size = gremlin_pool_size()
+            max_workers = settings.COSMOS_GREMLIN_MAX_WORKERS or pool_size
+            logger.info(f"Connecting to Cosmos DB Gremlin API at {endpoint} (pool_size={pool_size}, max_workers={max_workers})")
+
+            # One long-lived client per process: the pooled websockets are reused
+            # by every request instead of paying a TCP+TLS handshake per query.
+            # The driver opens its websockets synchronously in the constructor: build it in a
+            # worker thread so startup (or a lazy reconnect) never stalls the event loop.
+            self.client = await asyncio.to_thread(
+                Client,
                 endpoint,
                 'g',
                 username=username,
                 password=password,
-                message_serializer=GraphSONSerializersV2d0()
+                message_serializer=OrjsonGraphSONSerializersV2d0(),
+                pool_size=pool_size,
+                max_workers=max_workers
             )
             logger.info("Successfully connected to Cosmos DB")
+
+            await self._warm_pool()
+
+            if settings.COSMOS_GREMLIN_KEEPALIVE_SECONDS > 0:
+                self._keepalive_task = asyncio.create_task(self._keepalive())
         except Exception as e:
             logger.error(f"Failed to connect to Cosmos DB: {e}")
             raise e
 
+    async def _warm_pool(self):
+        """
+        Authenticates the first COSMOS_GREMLIN_MIN_POOL_SIZE pooled connections up front
+        (concurrent pings land on different sockets), so early requests skip the SASL round trip.
+        """
+        warm = min(settings.COSMOS_GREMLIN_MIN_POOL_SIZE, gremlin_pool_size())
+        if warm <= 0:
+            return
+        results = await asyncio.gather(
+            *(self._execute_query("g.inject(1)") for _ in range(warm)),
+            return_exceptions=True
+        )
+        failed = sum(isinstance(r, Exception) for r in results)
+        if failed:
+            logger.warning(f"Gremlin pool warmup: {failed}/{warm} pings failed")
+        else:
+            logger.info(f"Gremlin pool warmed ({warm} connections)")
+
+    async def _keepalive(self):
+        """Pings Cosmos periodically so idle pooled connections stay warm."""
+        while self.client:
+            await asyncio.sleep(settings.COSMOS_GREMLIN_KEEPALIVE_SECONDS)
+            try:
+                await self._execute_query("g.inject(1)")
+            except Exception as e:
+                logger.warning(f"Gremlin keepalive failed: {e}")
+
     async def close(self):
+        if self._keepalive_task:
+            self._keepalive_task.cancel()
+            self._keepalive_task = None
         if self.client:
-            self.client.close()
+            # The driver closes its transports on their own loops: do it off the event loop thread
+            await asyncio.to_thread(self.client.close)
             self.client = None
             logger.info("Cosmos DB connection closed")
 
@@ -73,6 +297,20 @@ class GraphRepository:
         if value is None: return ""
         return str(value).replace("'", "\\'")
 
+    def _property_steps(self, properties: Dict[str, Any], skip_keys: frozenset = frozenset(), prefix: str = "p"):
+        """
+        '.property(key, pN)' steps plus their bindings. Values are bound (stored as strings, as before),
+        so the query text only varies with the set of keys and Cosmos can reuse its plan.
+        """
+        steps = ""
+        bindings: Dict[str, Any] = {}
+        for j, (key, value) in enumerate(properties.items()):
+            if key in skip_keys or value is None: continue
+            name = f"{prefix}{j}"
+            bindings[name] = str(value)
+            steps += f".property('{self._escape(key)}', {name})"
+        return steps, bindings
+
     def _clean_gremlin_data(self, data_list: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         CRITICAL UI HELPER:
@@ -80,241 +318,537 @@ class GraphRepository:
         2. Sets 'label' to Display Name.
         3. Sets 'type' to Category.
         """
-        cleaned_list = []
-        for item in data_list:
-            flat_item = {}
-            for key, val in item.items():
-                if isinstance(val, list) and len(val) == 1:
-                    flat_item[key] = val[0]
-                else:
-                    flat_item[key] = val
-            
-            node_id = str(flat_item.get("id", ""))
-            gremlin_category = str(flat_item.get("label", "Node"))
-            display_name = flat_item.get("name") or node_id
-
-            final_item = {
-                "id": node_id,
-                "label": display_name,   
-                "type": gremlin_category, 
-                "properties": {} 
-            }
-
-            for key, val in flat_item.items():
-                if key in ["id", "label"]: continue
-                final_item["properties"][key] = val
-            
-            final_item["properties"]["originalLabel"] = display_name 
-            final_item["properties"]["type"] = gremlin_category 
-            final_item["properties"]["label"] = display_name 
-            if self.pk_key in flat_item:
-                final_item["properties"][self.pk_key] = flat_item[self.pk_key]
+        return [_clean_vertex(item) for item in data_list]
 
-            cleaned_list.append(final_item)
-        return cleaned_list
+    def _retry_after_seconds(self, exc: Exception) -> Optional[float]:
+        """Reads Cosmos' x-ms-retry-after-ms from a GremlinServerError's status attributes, if present."""
+        attributes = getattr(exc, "status_attributes", None) or {}
+        try:
+            retry_after_ms = attributes.get("x-ms-retry-after-ms")
+            return float(retry_after_ms) / 1000.0 if retry_after_ms is not None else None
+        except (TypeError, ValueError, AttributeError):
+            return None
 
     async def _execute_query(self, query: str, bindings: Dict[str, Any] = None) -> Any:
         """Centralized execution with Retry Logic (429/404 handling)."""
         if not self.client: await self.connect()
 
         retries = 0
-        MAX_RETRIES = 5
         
         while True:
             try:
                 if bindings:
-                    result_set = self.client.submit_async(query, bindings=bindings).result()
+                    future = self.client.submit_async(query, bindings=bindings)
                 else:
-                    result_set = self.client.submit_async(query).result()
+                    future = self.client.submit_async(query)
                 
-                return result_set.all().result()
+                # Await the driver futures instead of blocking on .result(),
+                # so concurrent queries (asyncio.gather) actually overlap.
+                result_set = await asyncio.wrap_future(future)
+                return await asyncio.wrap_future(result_set.all())
 
             except Exception as exc:
-                error_msg = str(exc)
-                
-                # Handle Rate Limiting
-                if "429" in error_msg or "RequestRateTooLarge" in error_msg:
-                    retries += 1
-                    if retries > MAX_RETRIES:
-                        logger.error(f"Max retries exceeded: {query}")
-                        raise exc
-                    wait_time = (0.5 * (2 ** retries)) + (random.randint(0, 100) / 1000.0)
-                    logger.warning(f"Throttled (429). Retrying in {wait_time:.2f}s...")
-                    await asyncio.sleep(wait_time)
-                
-                elif "404" in error_msg:
+                retries += 1
+                if not await self._should_retry(exc, retries, query):
                     return []
-                
+
+    async def _stream_query(self, query: str, bindings: Dict[str, Any] = None) -> AsyncIterator[List[Any]]:
+        """
+        Like _execute_query, but yields each response frame as Cosmos sends it instead of
+        buffering the whole result, so callers can process rows while the rest is in flight.
+        Throttling is only retried before the first frame (a retry after that would repeat rows).
+        """
+        if not self.client: await self.connect()
+
+        retries = 0
+
+        while True:
+            yielded = False
+            try:
+                if bindings:
+                    future = self.client.submit_async(query, bindings=bindings)
                 else:
-                    logger.error(f"Query Error: {exc} | Query: {query}")
-                    raise exc
+                    future = self.client.submit_async(query)
+                result_set = await asyncio.wrap_future(future)
+
+                # The driver thread puts each frame on result_set.stream and resolves
+                # result_set.done after the last one (or with the server error).
+                done = asyncio.wrap_future(result_set.done)
+                while True:
+                    while not result_set.stream.empty():
+                        yielded = True
+                        yield result_set.stream.get_nowait()
+                    if done.done(): break
+                    await asyncio.wait({done}, timeout=STREAM_POLL_SECONDS)
+                while not result_set.stream.empty():
+                    yielded = True
+                    yield result_set.stream.get_nowait()
+                done.result()
+                return
+
+            except Exception as exc:
+                if yielded: raise
+                retries += 1
+                if not await self._should_retry(exc, retries, query):
+                    return
+
+    async def _should_retry(self, exc: Exception, retries: int, query: str) -> bool:
+        """Backs off and returns True on throttling, False on 404 (empty graph); re-raises anything else."""
+        MAX_RETRIES = 5
+        error_msg = str(exc)
+        
+        # Handle Rate Limiting
+        if "429" in error_msg or "RequestRateTooLarge" in error_msg or "Request rate is large" in error_msg:
+            if retries > MAX_RETRIES:
+                logger.error(f"Max retries exceeded: {query}")
+                raise exc
+            # Prefer Cosmos' own hint (x-ms-retry-after-ms), else exponential backoff
+            wait_time = self._retry_after_seconds(exc)
+            if wait_time is None:
+                wait_time = 0.5 * (2 ** retries)
+            wait_time += random.randint(0, 100) / 1000.0
+            logger.warning(f"Throttled (429). Retrying in {wait_time:.2f}s...")
+            await asyncio.sleep(wait_time)
+            return True
+        
+        if "404" in error_msg:
+            return False
+        
+        logger.error(f"Query Error: {exc} | Query: {query}")
+        raise exc
+
+    async def _fetch_clean(self, query: str, bindings: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+        """Streams a valueMap(true) query and cleans each frame as it lands; raw rows never pile up."""
+        cleaned: List[Dict[str, Any]] = []
+        async for frame in self._stream_query(query, bindings):
+            cleaned.extend(self._clean_gremlin_data(frame))
+        return cleaned
 
     # ==========================================
     # 3. CORE GRAPH OPERATIONS
     # ==========================================
 
-    async def fetch_combined_graph(self, limit: int = 500, types: List[str] = None, document_id: str = None) -> Dict[str, Any]:
-        try:
-            node_query = "g.V()"
-            edge_query = "g.E()"
-
-            if document_id:
-                safe_id = self._escape(document_id)
-                node_query += f".has('documentId', '{safe_id}')"
-                edge_query += f".has('doc', '{safe_id}')"
-            else:
-                node_query += f".limit({limit})"
-                edge_query += f".limit({limit*2})"
+    def _combined_graph_queries(self, limit: int, types: Optional[List[str]], document_id: Optional[str],
+                                after: Optional[Dict[str, str]] = None, fields: Optional[List[str]] = None,
+                                paged: bool = False):
+        """
+        Builds the bound node and edge queries behind /fetch: (node_query, node_bindings, edge_query, edge_bindings).
+        'fields' limits node/edge properties to those keys, server-side (id/label/endpoints are always kept).
+        Without a document filter, a paged walk ('paged' on its first page, 'after' on later ones) is keyset-ordered
+        by id: 'after' holds the last node ('n') / edge ('e') id of the previous page, so later pages seek past it
+        instead of rescanning from the top. Unpaged fetches are not sorted.
+        """
+        # Values go in as bindings: the query text only depends on the filter shape,
+        # so one server-side plan serves every document / limit (and the text itself is built once per shape).
+        after_n = bool(after) and after.get("n") is not None
+        after_e = bool(after) and after.get("e") is not None
+        ordered = not document_id and (paged or after is not None)
+        node_query, edge_query = _combined_graph_templates(
+            bool(document_id), len(types or ()), ordered,
+            after_n and not document_id, after_e and not document_id, len(fields or ())
+        )
 
-            if types:
-                types_str = "','".join(types)
-                node_query += f".hasLabel('{types_str}')"
+        node_bindings: Dict[str, Any] = {f"t{i}": t for i, t in enumerate(types or ())}
+        edge_bindings: Dict[str, Any] = {}
+        if document_id:
+            node_bindings["did"] = edge_bindings["did"] = document_id
+        else:
+            if after_n:
+                node_bindings["nafter"] = after["n"]
+            if after_e:
+                edge_bindings["eafter"] = after["e"]
+            node_bindings["nlim"] = limit
+            edge_bindings["elim"] = limit * 2
+
+        field_bindings = {f"f{i}": f for i, f in enumerate(fields or ())}
+        node_bindings.update(field_bindings)
+        edge_bindings.update(field_bindings)
+        return node_query, node_bindings, edge_query, edge_bindings
+
+    async def fetch_combined_graph(self, limit: int = 500, types: List[str] = None, document_id: str = None,
+                                   after: Optional[Dict[str, str]] = None, fields: Optional[List[str]] = None,
+                                   paged: bool = False) -> Dict[str, Any]:
+        """
+        Nodes + edges for the map. Paged whole-graph fetches ('paged' or 'after') also return 'next': the {'n', 'e'}
+        keys to pass back as 'after' for the following page (a side is omitted once exhausted), or None on the last page.
+        """
+        try:
+            node_query, node_bindings, edge_query, edge_bindings = self._combined_graph_queries(
+                limit, types, document_id, after, fields, paged
+            )
 
-            node_query += ".valueMap(true)"
-            edge_query += ".project('id', 'label', 'source', 'target', 'properties').by(id).by(label).by(outV().id()).by(inV().id()).by(valueMap())"
+            async def none() -> list: return []
+            # On a continued page, a side missing from 'after' has already been fully read
+            read_nodes = after is None or "n" in after
+            read_edges = after is None or "e" in after
 
-            raw_nodes = await self._execute_query(node_query)
-            raw_edges = await self._execute_query(edge_query)
+            # Node and edge reads are independent: one round-trip of wall time instead of two
+            # Nodes are cleaned frame by frame as they stream in
+            clean_nodes, raw_edges = await asyncio.gather(
+                self._fetch_clean(node_query, node_bindings) if read_nodes else none(),
+                self._execute_query(edge_query, edge_bindings) if read_edges else none()
+            )
+            raw_edges = raw_edges or []
 
-            clean_nodes = self._clean_gremlin_data(raw_nodes or [])
+            next_page = None
+            if not document_id and (paged or after is not None):
+                next_page = {}
+                if len(clean_nodes) >= limit: next_page["n"] = clean_nodes[-1]["id"]
+                if len(raw_edges) >= limit * 2: next_page["e"] = raw_edges[-1]["id"]
 
             return {
                 "nodes": clean_nodes, 
-                "edges": raw_edges or [], 
-                "meta": {"count": {"nodes": len(clean_nodes), "edges": len(raw_edges or [])}}
+                "edges": raw_edges, 
+                "meta": {"count": {"nodes": len(clean_nodes), "edges": len(raw_edges)}},
+                "next": next_page or None
             }
         except Exception as exc:
             logger.error(f"Fetch failed: {exc}")
             return {"nodes": [], "edges": [], "error": str(exc)}
 
+    async def fetch_combined_graph_stream(self, limit: int = 500, types: List[str] = None, document_id: str = None,
+                                          fields: Optional[List[str]] = None) -> AsyncIterator[tuple]:
+        """
+        Same reads as fetch_combined_graph, yielded as ('node' | 'edge', rows) per Cosmos response frame,
+        so only one frame is held in memory at a time. Nodes come first, then edges.
+        """
+        node_query, node_bindings, edge_query, edge_bindings = self._combined_graph_queries(limit, types, document_id, fields=fields)
+        async for frame in self._stream_query(node_query, node_bindings):
+            yield "node", self._clean_gremlin_data(frame)
+        async for frame in self._stream_query(edge_query, edge_bindings):
+            yield "edge", frame
+
     # ==========================================
     # 4. CRUD OPERATIONS (✅ FIXED FOR PROPERTIES)
     # ==========================================
 
     async def create_entity(self, entity_id: str, label: str, properties: Dict[str, Any]) -> None:
         """Creates or Updates (Upsert) a node and ensures properties are saved."""
-        prop_str = ""
-        skip_keys = ["id", "pk", "partitionKey", self.pk_key]
-
-        for key, value in properties.items():
-            if key in skip_keys or value is None: continue
-            safe_val = self._escape(value)
-            prop_str += f".property('{key}', '{safe_val}')"
-        
+        properties = _with_search_key(entity_id, label, properties)
+        prop_str, bindings = self._property_steps(properties, frozenset({"id", "pk", "partitionKey", self.pk_key}))
         pk_val = properties.get(self.pk_key) or properties.get("partitionKey") or entity_id
 
         # ✅ FIX: Appends .property() to the RESULT of coalesce.
         # This guarantees properties are updated even if the node already exists.
         query = (
-            f"g.V('{entity_id}').fold().coalesce("
-            f"unfold(), "
-            f"addV('{label}')"
-            f".property('id', '{entity_id}')"
-            f".property('{self.pk_key}', '{pk_val}')"
+            "g.V(eid).fold().coalesce("
+            "unfold(), "
+            "addV(lbl)"
+            ".property('id', eid)"
+            f".property('{self.pk_key}', pkv)"
             f"){prop_str}" 
         )
-        await self._execute_query(query)
+        await self._execute_query(query, {**bindings, "eid": entity_id, "lbl": label, "pkv": pk_val})
+        await self.mark_document_counts_stale([properties.get("documentId")])
+        await graph_version.bump()
+
+    async def create_entities(self, entities: List[tuple]) -> None:
+        """
+        Bulk form of create_entity for (entity_id, label, properties) rows. Each row is its own bound
+        upsert starting at g.V(eid) (the only V() Cosmos serves from its index; a mid-traversal V(id)
+        is a full scan), with ENTITY_UPSERT_CONCURRENCY in flight and ONE graph version bump at the end.
+        """
+        skip_keys = frozenset({"id", "pk", "partitionKey", self.pk_key})
+        semaphore = asyncio.Semaphore(ENTITY_UPSERT_CONCURRENCY)
+
+        async def upsert(entity_id: str, label: str, properties: Dict[str, Any]):
+            pk_val = properties.get(self.pk_key) or properties.get("partitionKey") or entity_id
+            prop_str, bindings = self._property_steps(_with_search_key(entity_id, label, properties), skip_keys)
+            query = (
+                "g.V(eid).fold().coalesce(unfold(), "
+                f"addV(lbl).property('id', eid).property('{self.pk_key}', pkv))"
+                f"{prop_str}"
+            )
+            async with semaphore:
+                await self._execute_query(query, {**bindings, "eid": entity_id, "lbl": label, "pkv": pk_val})
+
+        await asyncio.gather(*(upsert(*row) for row in entities))
+        await self.mark_document_counts_stale([properties.get("documentId") for _, _, properties in entities])
+        await graph_version.bump()
 
     async def create_relationship(self, from_id: str, to_id: str, label: str, properties: Dict[str, Any] = None) -> None:
         """Creates or Updates an edge and ensures properties are saved."""
-        prop_str = ""
-        if properties:
-            for key, value in properties.items():
-                if value is None: continue
-                safe_val = self._escape(value)
-                prop_str += f".property('{key}', '{safe_val}')"
+        await self._upsert_relationship(from_id, to_id, label, properties or {})
+        await self.mark_document_counts_stale([(properties or {}).get("doc")])
+        await graph_version.bump()
+
+    async def create_relationships(self, edges: List[tuple]) -> None:
+        """
+        Bulk form of create_relationship for (from_id, to_id, label, properties) rows: EDGE_UPSERT_BATCH
+        upserts at a time, then ONE stale-marking of the documents touched and one graph version bump.
+        """
+        for i in range(0, len(edges), EDGE_UPSERT_BATCH):
+            if i:
+                await asyncio.sleep(0.05)
+            await asyncio.gather(*(self._upsert_relationship(*edge) for edge in edges[i:i + EDGE_UPSERT_BATCH]))
+        await self.mark_document_counts_stale([properties.get("doc") for *_, properties in edges])
+        await graph_version.bump()
+
+    async def _upsert_relationship(self, from_id: str, to_id: str, label: str, properties: Dict[str, Any]) -> None:
+        prop_str, bindings = self._property_steps(properties)
 
         # ✅ FIX: Appends .property() OUTSIDE the addE() parenthesis.
         # This guarantees properties are updated even if the edge already exists.
         query = (
-            f"g.V('{from_id}').coalesce("
-            f"outE('{label}').where(inV().hasId('{to_id}')),"
-            f"addE('{label}').to(g.V('{to_id}'))"
+            "g.V(fid).coalesce("
+            "outE(lbl).where(inV().hasId(tid)),"
+            "addE(lbl).to(g.V(tid))"
             f"){prop_str}" 
         )
-        await self._execute_query(query)
+        await self._execute_query(query, {**bindings, "fid": from_id, "tid": to_id, "lbl": label})
 
-    async def update_entity(self, entity_id: str, properties: Dict[str, Any], partition_key: str = None) -> None:
+    async def create_relationships_to(self, from_ids: List[str], to_id: str, label: str, properties: Dict[str, Any] = None) -> None:
+        """
+        Upserts the same edge from many sources to one target (e.g. members -> Community)
+        as one bound traversal per chunk of ids, instead of one round trip per edge.
+        """
+        BATCH_SIZE = 100
+        prop_str, prop_bindings = self._property_steps(properties or {})
+
+        semaphore = asyncio.Semaphore(4)
+
+        async def link(chunk: List[str]):
+            id_bindings = {f"v{i}": vid for i, vid in enumerate(chunk)}
+            query = (
+                f"g.V({','.join(id_bindings)}).coalesce("
+                "outE(lbl).where(inV().hasId(tid)),"
+                "addE(lbl).to(g.V(tid))"
+                f"){prop_str}"
+            )
+            async with semaphore:
+                await self._execute_query(query, {**id_bindings, **prop_bindings, "tid": to_id, "lbl": label})
+
+        await asyncio.gather(*(link(from_ids[i:i + BATCH_SIZE]) for i in range(0, len(from_ids), BATCH_SIZE)))
+        await graph_version.bump()
+
+    async def update_entity(self, entity_id: str, properties: Dict[str, Any], partition_key: str = None,
+                            label: Optional[str] = None) -> Optional[int]:
+        """
+        Updates a vertex's properties; returns the shared graph version the write produced (see GraphVersion.bump).
+        'label' is the vertex label a rename recomposes searchKey with; without it, a rename reads the stored one.
+        """
         # ✅ FIX: Read PK from properties first so Cosmos DB can actually find the node!
         pk_val = partition_key or properties.get(self.pk_key) or properties.get("partitionKey") or entity_id
         
-        query = f"g.V('{entity_id}').has('{self.pk_key}', '{pk_val}')"
-        
-        for k, v in properties.items():
-            if k in ["id", self.pk_key, "partitionKey"]: continue
-            safe_v = self._escape(v)
-            query += f".property('{k}', '{safe_v}')"
+        if "name" in properties:
+            if label is None:
+                rows = await self._execute_query(ENTITY_LABEL_QUERY, {"eid": entity_id, "pkv": pk_val}) or []
+                label = rows[0] if rows else None
+            if label is not None:
+                properties = _with_search_key(entity_id, label, properties)
+
+        prop_str, bindings = self._property_steps(properties, frozenset({"id", self.pk_key, "partitionKey"}))
+        query = f"g.V(eid).has('{self.pk_key}', pkv)"
+        retag = bool(properties.get("documentId"))
+        if retag:
+            # Re-tagging moves the vertex between documents (both documents' stored counts go stale):
+            # the same traversal hands back the documentId it replaced, so no separate read is needed
+            query += f".as('v').coalesce(values('documentId'), constant('')).as('prev').select('v'){prop_str}.select('prev')"
+        else:
+            query += prop_str
             
         logger.info(f"Executing Update Query: {query}")
-        await self._execute_query(query)
+        previous_docs = await self._execute_query(query, {**bindings, "eid": entity_id, "pkv": pk_val}) or []
+        if retag:
+            await self.mark_document_counts_stale([properties["documentId"], *previous_docs])
+        return await graph_version.bump()
 
     async def delete_entity(self, entity_id: str, partition_key: str = None) -> None:
         pk_val = partition_key if partition_key else entity_id
-        query = f"g.V('{entity_id}').has('{self.pk_key}', '{pk_val}').drop()"
-        await self._execute_query(query)
+        bindings = {"eid": entity_id, "pkv": pk_val}
+        affected_docs = await self._execute_query(ENTITY_DOCUMENTS_QUERY, bindings) or []
+        await self._execute_query(DELETE_ENTITY_QUERY, bindings)
+        await self.mark_document_counts_stale(affected_docs)
+        await graph_version.bump()
+
+    async def delete_entities(self, keys: List[tuple]) -> None:
+        """
+        Batch form of delete_entity for (entity_id, partition_key) pairs: one bound
+        g.V().has(pk, pkv).hasId(within(...)).drop() per partition and chunk of ids, instead of one per vertex.
+        """
+        by_partition: Dict[str, List[str]] = {}
+        for entity_id, partition_key in keys:
+            by_partition.setdefault(partition_key or entity_id, []).append(entity_id)
+
+        async def drop(pk_val: str, ids: List[str]) -> List[str]:
+            bindings = {f"i{i}": eid for i, eid in enumerate(ids)}
+            vertices = f"g.V().has('{self.pk_key}', pkv).hasId(within({','.join(bindings)}))"
+            bindings["pkv"] = pk_val
+            affected_docs = await self._execute_query(
+                f"{vertices}.union(values('documentId'), bothE().values('doc')).dedup()", bindings
+            ) or []
+            await self._execute_query(f"{vertices}.drop()", bindings)
+            return affected_docs
+
+        affected = await asyncio.gather(*(
+            drop(pk_val, ids[i:i + ENTITY_DELETE_CHUNK])
+            for pk_val, ids in by_partition.items() for i in range(0, len(ids), ENTITY_DELETE_CHUNK)
+        ))
+        await self.mark_document_counts_stale([doc for docs in affected for doc in docs])
+        await graph_version.bump()
 
     async def update_relationship(self, rel_id: str, properties: Dict[str, Any]) -> None:
-        query = f"g.E('{rel_id}')"
-        for k, v in properties.items():
-            safe_val = self._escape(v)
-            query += f".property('{k}', '{safe_val}')"
-        await self._execute_query(query)
+        previous_docs = []
+        if properties.get("doc"):
+            previous_docs = await self._execute_query(RELATIONSHIP_DOCUMENT_QUERY, {"rid": rel_id}) or []
+
+        prop_str, bindings = self._property_steps(properties)
+        await self._execute_query(f"g.E(rid){prop_str}", {**bindings, "rid": rel_id})
+        if properties.get("doc"):
+            await self.mark_document_counts_stale([properties["doc"], *previous_docs])
+        await graph_version.bump()
 
     async def delete_relationship(self, rel_id: str) -> None:
-        await self._execute_query(f"g.E('{rel_id}').drop()")
+        previous_docs = await self._execute_query(RELATIONSHIP_DOCUMENT_QUERY, {"rid": rel_id}) or []
+        await self._execute_query(DELETE_RELATIONSHIP_QUERY, {"rid": rel_id})
+        await self.mark_document_counts_stale(previous_docs)
+        await graph_version.bump()
 
-    async def delete_data_by_filename(self, filename: str) -> None:
+    async def delete_data_by_filename(self, filename: str) -> int:
+        """
+        Drops every vertex (and its edges) of a document, returning how many vertices were removed.
+        Errors propagate to the caller; once drops have been sent the graph version is bumped and
+        linked documents are marked stale even on failure, since a partial delete still changed the graph.
+        """
         BATCH_SIZE = 500
-        try:
-            safe_id = self._escape(filename)
-            logger.info(f"Deleting data for documentId='{safe_id}'")
-            
-            count_query = f"g.V().has('documentId', '{safe_id}').count()"
+        logger.info(f"Deleting data for documentId='{filename}'")
+        bindings = {"fid": filename, "batch": BATCH_SIZE}
+        # Edges of other documents attached to these vertices are dropped with them
+        linked_docs = await self._execute_query(DOCUMENT_LINKED_DOCUMENTS_QUERY, bindings) or []
+        
+        async def drop_vertices() -> int:
+            # Drop and count in the same traversal: a short batch means nothing is left,
+            # so no separate count() round trip is needed per batch.
+            total = 0
             while True:
-                res = await self._execute_query(count_query)
-                if not res or res[0] == 0: break
-                
-                await self._execute_query(f"g.V().has('documentId', '{safe_id}').limit({BATCH_SIZE}).drop()")
+                res = await self._execute_query(DELETE_DOCUMENT_BATCH_QUERY, bindings)
+                dropped = res[0] if res else 0
+                total += dropped
+                if dropped < BATCH_SIZE: return total
                 await asyncio.sleep(0.1) 
-            
-            await self._execute_query(f"g.E().has('doc', '{safe_id}').drop()")
-            logger.info("Cleared graph data for document: %s", filename)
+        
+        try:
+            # Vertex drops take their edges along; the edge sweep only catches edges tagged with
+            # the doc elsewhere. The two are independent (an edge already gone is simply not matched),
+            # so the sweep overlaps the vertex batches instead of waiting for them.
+            removed, _ = await asyncio.gather(
+                drop_vertices(),
+                self._execute_query(DELETE_DOCUMENT_EDGES_QUERY, bindings)
+            )
         except Exception as exc:
             logger.error(f"Failed to clear document data for {filename}: {exc}")
-            pass
+            raise
+        finally:
+            await self.mark_document_counts_stale([doc for doc in linked_docs if doc != filename])
+            await graph_version.bump()
+        logger.info("Cleared graph data for document: %s (%d vertices)", filename, removed)
+        return removed
+
+    async def mark_document_counts_stale(self, document_ids: List[str]) -> None:
+        """Flags stored Document counts as outdated (nodeCount -1) after a write that moved elements between documents."""
+        fids = list(dict.fromkeys(str(fid) for fid in document_ids if fid))
+        if not fids:
+            return
+        try:
+            bindings = {f"f{i}": fid for i, fid in enumerate(fids)}
+            await self._execute_query(MARK_DOCUMENT_COUNTS_STALE_QUERY.format(fids=",".join(bindings)), bindings)
+        except Exception as exc:
+            logger.error(f"Failed to mark document counts stale for {fids}: {exc}")
+
+    async def refresh_document_counts(self, filename: str) -> None:
+        """
+        Stores nodeCount/edgeCount on the document's Document vertex so listings read one
+        vertex per document instead of aggregating every tagged element. Write-path only.
+        """
+        try:
+            nodes, edges = await self.count_document(filename)
+            await self._execute_query(SET_DOCUMENT_COUNTS_QUERY, {"fid": filename, "nc": nodes, "ec": edges})
+            await graph_version.bump()
+        except Exception as exc:
+            logger.error(f"Failed to refresh document counts for {filename}: {exc}")
+
+    async def count_document(self, filename: str) -> tuple:
+        """Live (vertex, edge) counts of one document, from its indexed documentId/doc tags."""
+        bindings = {"fid": filename}
+        nodes, edges = await asyncio.gather(
+            self._execute_query(DOCUMENT_NODE_COUNT_QUERY, bindings),
+            self._execute_query(DOCUMENT_EDGE_COUNT_QUERY, bindings)
+        )
+        return (nodes[0] if nodes else 0), (edges[0] if edges else 0)
 
     # ==========================================
     # 5. DATA RETRIEVAL
     # ==========================================
 
     async def get_stats(self) -> Dict[str, Any]:
-        nodes_res = await self._execute_query("g.V().count()")
-        edges_res = await self._execute_query("g.E().count()")
+        # Independent counts: dispatch both so the wait is the slower one, not the sum
+        nodes_res, edges_res = await asyncio.gather(
+            self._execute_query(VERTEX_COUNT_QUERY),
+            self._execute_query(EDGE_COUNT_QUERY)
+        )
         return {"nodes": nodes_res[0] if nodes_res else 0, "edges": edges_res[0] if edges_res else 0}
 
     async def search_nodes(self, keyword: str, limit: int = 20) -> List[Dict[str, Any]]:
-        query = f"g.V().has('label', TextP.containing('{keyword}')).limit({limit}).valueMap(true)"
-        raw = await self._execute_query(query)
-        return self._clean_gremlin_data(raw)
+        rows = await self._execute_query(SEARCH_NODES_QUERY, {"q": keyword.lower(), "lim": limit})
+        return [_search_hit(row) for row in rows or []]
+
+    async def backfill_search_keys(self) -> int:
+        """
+        One-off migration: stores searchKey on vertices created before it existed, so /search finds them.
+        Pages until none are left (or a page only returns vertices already tried); returns how many were updated.
+        """
+        semaphore = asyncio.Semaphore(ENTITY_UPSERT_CONCURRENCY)
+        attempted: set = set()
+
+        async def backfill(row: Dict[str, Any]):
+            key = _with_search_key(row["id"], row["label"], {"name": row["name"]})["searchKey"]
+            async with semaphore:
+                if row["pk"]:
+                    await self._execute_query(SET_SEARCH_KEY_QUERY, {"eid": row["id"], "pkv": row["pk"], "sk": key})
+                else:
+                    await self._execute_query("g.V(eid).property('searchKey', sk)", {"eid": row["id"], "sk": key})
+
+        while True:
+            rows = await self._execute_query(MISSING_SEARCH_KEY_QUERY, {"lim": SEARCH_KEY_BACKFILL_BATCH})
+            fresh = [row for row in rows or [] if (row["id"], row["pk"]) not in attempted]
+            if not fresh:
+                if rows:
+                    logger.warning("searchKey backfill stopped: %d vertices could not be updated", len(rows))
+                break
+            attempted.update((row["id"], row["pk"]) for row in fresh)
+            await asyncio.gather(*(backfill(row) for row in fresh))
+
+        if attempted:
+            await graph_version.bump()
+        return len(attempted)
 
     async def clear_graph(self, scope: str = "all") -> bool:
         try:
-            if scope == "all": await self._execute_query("g.V().drop()")
+            if scope == "all":
+                await self._execute_query("g.V().drop()")
+                await graph_version.bump()
             return True
         except: return False
     
+    async def get_entity(self, entity_id: str) -> Optional[Dict[str, Any]]:
+        """One vertex with all its properties (lazy hydration after a lean /fetch), or None."""
+        cleaned = self._clean_gremlin_data(await self._execute_query(ENTITY_QUERY, {"eid": entity_id}) or [])
+        return cleaned[0] if cleaned else None
+
     async def get_entities(self, label: Optional[str] = None) -> List[Dict[str, Any]]:
-        q = f"g.V().hasLabel('{label}').valueMap(true)" if label else "g.V().valueMap(true)"
-        raw = await self._execute_query(q)
-        return self._clean_gremlin_data(raw)
+        # Full-entity scans: clean each frame as it arrives instead of buffering every raw row first
+        if label:
+            return await self._fetch_clean(ENTITIES_BY_LABEL_QUERY, {"lbl": label})
+        return await self._fetch_clean(ENTITIES_QUERY)
 
     async def get_relationships(self) -> List[Dict[str, Any]]:
-        return await self._execute_query("g.E().project('id', 'label', 'source', 'target', 'properties').by(id).by(label).by(outV().id()).by(inV().id()).by(valueMap())")
+        return await self._execute_query(RELATIONSHIPS_QUERY)
 
     async def get_graph(self) -> Dict[str, Any]:
+        nodes, edges = await asyncio.gather(self.get_entities(), self.get_relationships())
         return {
-            "nodes": await self.get_entities(),
-            "edges": await self.get_relationships()
+            "nodes": nodes,
+            "edges": edges
         }
 
     # ==========================================
@@ -325,12 +859,16 @@ class GraphRepository:
         Fetches all edges connected to a specific entity.
         Fixed to use .project() instead of .elementMap() for Cosmos DB compatibility.
         """
-        query = (
-            f"g.V('{entity_id}').bothE()"
-            f".project('id', 'label', 'source', 'target', 'properties', 'riskCategory')"
-            f".by(id).by(label).by(outV().id()).by(inV().id()).by(valueMap())"
-            f".by(coalesce(values('riskCategory'), constant('')))"
-        )
-        return await self._execute_query(query)
+        return await self._execute_query(ENTITY_RELATIONSHIPS_QUERY, {"eid": entity_id})
+
+    async def get_relationships_for_entities(self, entity_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """get_relationships_for_entity for many ids in ONE traversal: {entity_id: edges} (absent ids are left out)."""
+        bindings = {f"id{i}": eid for i, eid in enumerate(entity_ids)}
+        rows = await self._execute_query(f"g.V({','.join(bindings)})" + ENTITIES_RELATIONSHIPS_PROJECTION, bindings)
+        edges_by_id: Dict[str, List[Dict[str, Any]]] = {}
+        for row in rows or []:
+            # The same id may exist in several partitions: merge their edges, as g.V(eid).bothE() would
+            edges_by_id.setdefault(row["id"], []).extend(row["edges"])
+        return edges_by_id
 
 graph_repository = GraphRepository()
\ No newline at end of file
@@ -0,0 +1,24 @@
+"""
+One-off: store 'searchKey' on vertices written before /search switched to it.
+Run from the project root with the usual .env: python -m app.scripts.backfill_search_keys
+"""
+import asyncio
+import logging
+
+from app.repositories.graph_repository import graph_repository
+
+logger = logging.getLogger(__name__)
+
+
+async def main() -> None:
+    await graph_repository.connect()
+    try:
+        updated = await graph_repository.backfill_search_keys()
+        logger.info("searchKey backfilled on %d vertices", updated)
+    finally:
+        await graph_repository.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(main())
@@ -1,9 +1,10 @@
 import logging
 import io
+import asyncio
 import re
 import json
 import pandas as pd
-from typing import Dict, Any, List
+from typing import Dict, Any, List, BinaryIO
 
 # If you have the SchemaRegistry, keep this import.
 # from app.services.schema_registry import SchemaRegistry 
@@ -42,28 +43,30 @@ class DocumentProcessor:
         return "general", base
 
     # --- MAIN PROCESSOR ---
-    async def process_file(self, file_content: bytes, filename: str) -> Dict[str, Any]:
+    async def process_file(self, file: BinaryIO, filename: str) -> Dict[str, Any]:
+        """'file' is the binary upload stream (e.g. UploadFile.file), positioned at the start."""
         logger.info(f"DocumentProcessor: Processing {filename}")
-        
-        # 1. DECODE CONTENT
-        try:
-            text_content = file_content.decode("utf-8")
-        except UnicodeDecodeError:
-            text_content = file_content.decode("latin-1")
 
-        # 2. ROUTING LOGIC
         # We import inside the method to avoid circular imports if graph_service imports this file
         from app.services.graph_service import graph_service
 
         if filename.lower().endswith(".csv"):
             # --- CRITICAL FIX ---
             # Do NOT convert CSV to narrative text sentences.
-            # Pass the RAW CSV string directly to GraphService.
+            # Pass the RAW CSV stream directly to GraphService (parsed there, never decoded to one big str).
             # This enables the "Star-Chain" logic (Row -> Event -> Context).
             logger.info("Detected CSV: Sending raw data to Star-Chain Engine.")
-            return await graph_service.process_narrative(text_content, filename)
-        
-        elif filename.lower().endswith(".txt") or filename.lower().endswith(".md"):
+            return await graph_service.process_csv_file(file, filename)
+
+        # 1. DECODE CONTENT (text needs the whole document; read it off the event loop)
+        file_content = await asyncio.to_thread(file.read)
+        try:
+            text_content = file_content.decode("utf-8")
+        except UnicodeDecodeError:
+            text_content = file_content.decode("latin-1")
+
+        # 2. ROUTING LOGIC
+        if filename.lower().endswith(".txt") or filename.lower().endswith(".md"):
             # For text files, we pass the content as-is (GraphService will use AI)
             logger.info("Detected Text: Sending to AI Engine.")
             return await graph_service.process_narrative(text_content, filename)
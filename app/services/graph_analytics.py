@@ -1,47 +1,88 @@
 import logging
 import json
+import hashlib
+import asyncio
 from typing import List, Dict, Any, Set
 from datetime import datetime
 
-from app.repositories.graph_repository import GraphRepository
+from app.repositories.graph_repository import graph_repository
+from app.db.result_cache import ResultCache, graph_version
 # Ensure these imports match your existing OpenAI configuration
 from app.services.openai_extractor import client as openai_client, AZURE_OPENAI_DEPLOYMENT
 
 logger = logging.getLogger(__name__)
 
+# Static community instructions: identical across clusters so Azure prompt caching can reuse the prefix.
+COMMUNITY_SYSTEM_PROMPT = """You are a Senior Process Mining Analyst reviewing a cluster of connected entities in an enterprise Knowledge Graph.
+You will receive the ENTITIES IN CLUSTER.
+
+TASK:
+Provide a hyper-concise, executive-level summary of what this cluster represents. Get straight to the point. No fluff.
+
+REQUIREMENTS:
+1. 'label': A strict, 2-to-3 word category (e.g., "Fraud Ring", "Auto Claim Lifecycle", "Blue-Collar Sales").
+2. 'theme': A 1-sentence description of the core business function or anomaly.
+3. 'summary': Maximum 2 sentences. State exactly what operational process this is, and if there is an obvious bottleneck or risk.
+
+Return ONLY valid JSON: { "theme": "...", "summary": "...", "label": "..." }
+"""
+
+# Level-by-level BFS with one shared visited set ('seen'): each vertex is expanded once, so the
+# search is O(V+E) even when dst is unreachable, unlike simplePath() which walks every simple path.
+SHORTEST_PATH_QUERY = (
+    "g.V(src).aggregate('seen')"
+    ".repeat(out().dedup().where(without('seen')).aggregate('seen'))"
+    ".until(hasId(dst)).limit(1).path().by(id)"
+)
+
+# Fingerprints of already-summarized clusters, stored on their Community vertices
+COMMUNITY_FINGERPRINTS_QUERY = (
+    "g.V().has('normType', 'Community').has('fingerprint')"
+    ".project('id', 'fingerprint').by(id).by('fingerprint')"
+)
+
+# Cluster summaries (Gremlin read + LLM call + writes) in flight at once
+COMMUNITY_SUMMARY_CONCURRENCY = 10
+
+# Edges written by detection itself; they must not feed back into the clustering
+MEMBERSHIP_LABEL = "BELONGS_TO"
+
+# Last full detection result per graph version (any graph write invalidates it)
+communities_cache = ResultCache("communities", ttl=3600)
+
+def _fingerprint(entity_ids: List[str]) -> str:
+    """Stable identity of a cluster: hash of its sorted member ids."""
+    return hashlib.blake2b("\x1f".join(sorted(entity_ids)).encode(), digest_size=16).hexdigest()
+
 class GraphAnalytics:
     def __init__(self):
-        self.repo = GraphRepository()
+        # Share the app-wide repository (and its pooled Gremlin client)
+        self.repo = graph_repository
 
     # --- SAFE GREMLIN EXECUTION HELPER ---
-    async def _execute_gremlin(self, query: str) -> Any:
+    async def _execute_gremlin(self, query: str, bindings: Dict[str, Any] = None) -> Any:
         """Safely executes Gremlin queries without Threading/Future crashes."""
         try:
-            client = getattr(self.repo, 'client', None)
-            if not client: return None
-            
-            submit = getattr(client, 'submitAsync', getattr(client, 'submit_async', getattr(client, 'submit', None)))
-            if not submit: return None
-            
-            future = submit(query)
-            result_set = future.result() if hasattr(future, 'result') else future
-            
-            if hasattr(result_set, 'all'):
-                results = result_set.all().result()
-            else:
-                results = result_set
-                
-            return results
+            # The repository's async-only path: awaited driver futures, no sync .result() fallback
+            return await self.repo._execute_query(query, bindings)
         except Exception as e:
             logger.error(f"[Analytics] Gremlin Query Failed: {e}")
             return None
 
-    async def detect_communities(self) -> Dict[str, Any]:
+    async def detect_communities(self, force: bool = False, concurrency: int = COMMUNITY_SUMMARY_CONCURRENCY) -> Dict[str, Any]:
         """
         1. Simple Clustering: Finds connected groups of entities.
         2. AI Summary: Asks OpenAI to find the 'theme' of each group.
         3. Persistence: Saves 'Community' nodes back to the graph.
+        Unchanged graph -> cached result; unchanged clusters (same member fingerprint) are not
+        re-summarized. force=True bypasses both.
+        Clusters are independent, so up to 'concurrency' of them are summarized at once.
         """
+        if not force:
+            cached = await communities_cache.get(str(await graph_version.current()))
+            if cached is not None:
+                return cached
+
         logger.info("[Analytics] Starting Community Detection...")
         
         # 1. Fetch all relationships to see the structure
@@ -54,7 +95,9 @@ class GraphAnalytics:
         clusters = self._simple_clustering(relationships)
         logger.info(f"[Analytics] Detected {len(clusters)} potential communities.")
 
-        communities_created = []
+        communities_reused = []
+        known = {} if force else await self._known_fingerprints()
+        pending = []
 
         # 3. Generate Summaries for each Cluster
         for cluster_id, entity_ids in clusters.items():
@@ -62,59 +105,63 @@ class GraphAnalytics:
             if len(entity_ids) < 3:
                 continue
 
-            summary_node = await self._generate_community_summary(cluster_id, entity_ids)
-            if summary_node:
-                communities_created.append(summary_node)
+            # Same members as an existing Community: its summary still holds, skip the LLM call
+            fingerprint = _fingerprint(entity_ids)
+            if fingerprint in known:
+                communities_reused.append(known[fingerprint])
+                continue
+            pending.append((cluster_id, entity_ids, fingerprint))
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def summarize(cluster_id: str, entity_ids: List[str], fingerprint: str):
+            async with semaphore:
+                return await self._generate_community_summary(cluster_id, entity_ids, fingerprint)
+
+        # Failures come back as None (logged inside), so one bad cluster doesn't cancel the rest
+        summaries = await asyncio.gather(*(summarize(*args) for args in pending))
+        communities_created = [node for node in summaries if node]
         
-        logger.info("[Analytics] Completed.")
-        return {
+        logger.info("[Analytics] Completed (%d summarized, %d unchanged).", len(communities_created), len(communities_reused))
+        result = {
             "communities_detected": len(clusters),
-            "new_community_nodes": communities_created
+            "new_community_nodes": communities_created,
+            "unchanged_community_nodes": communities_reused
         }
+        # Keyed after the writes above, so the next call on this same graph is a hit
+        await communities_cache.set(str(await graph_version.current()), result)
+        return result
+
+    async def _known_fingerprints(self) -> Dict[str, str]:
+        rows = await self._execute_gremlin(COMMUNITY_FINGERPRINTS_QUERY)
+        return {row["fingerprint"]: row["id"] for row in rows or []}
 
-    async def _generate_community_summary(self, cluster_id: str, entity_ids: List[str]) -> str:
+    async def _generate_community_summary(self, cluster_id: str, entity_ids: List[str], fingerprint: str) -> str:
         """Fetch group data, ask AI for a crisp business theme, and save as a Community node."""
         try:
             # 1. Fetch labels/content for entities using Gremlin safely
-            id_list = [f"'{eid}'" for eid in entity_ids]
-            query = f"g.V({','.join(id_list)}).project('id', 'label', 'props').by(id).by(label).by(valueMap())"
+            # Bound ids: the query text only varies with cluster size, so Cosmos can reuse the plan
+            bindings = {f"id{i}": eid for i, eid in enumerate(entity_ids)}
+            query = f"g.V({','.join(bindings)}).project('id', 'label', 'props').by(id).by(label).by(valueMap())"
             
-            entity_data = await self._execute_gremlin(query)
+            entity_data = await self._execute_gremlin(query, bindings)
             
             if not entity_data:
                 return None
 
             # 2. Format context for AI (Compress to save tokens)
-            context_items = []
-            for e in entity_data:
-                label = e.get('label', 'Unknown')
-                props = e.get('props', {})
-                name = props.get('name', [e.get('id')])[0] if isinstance(props.get('name'), list) else props.get('name', e.get('id'))
-                context_items.append(f"[{label}] {name}")
-            
-            context_text = "\n".join(context_items)
+            context_text = "\n".join(
+                f"[{e.get('label', 'Unknown')}] {self._entity_name(e)}" for e in entity_data
+            )
 
             # 3. UPGRADED AI PROMPT: Strictly "Up to the point" Executive Analysis
-            prompt = f"""
-            You are a Senior Process Mining Analyst reviewing a cluster of connected entities in an enterprise Knowledge Graph.
-            
-            ENTITIES IN CLUSTER:
-            {context_text[:5000]}
-
-            TASK:
-            Provide a hyper-concise, executive-level summary of what this cluster represents. Get straight to the point. No fluff.
-
-            REQUIREMENTS:
-            1. 'label': A strict, 2-to-3 word category (e.g., "Fraud Ring", "Auto Claim Lifecycle", "Blue-Collar Sales").
-            2. 'theme': A 1-sentence description of the core business function or anomaly.
-            3. 'summary': Maximum 2 sentences. State exactly what operational process this is, and if there is an obvious bottleneck or risk.
-
-            Return ONLY valid JSON: {{ "theme": "...", "summary": "...", "label": "..." }}
-            """
-
+            # Static instructions first (cacheable prefix), cluster data last
             response = await openai_client.chat.completions.create(
                 model=AZURE_OPENAI_DEPLOYMENT,
-                messages=[{"role": "user", "content": prompt}],
+                messages=[
+                    {"role": "system", "content": COMMUNITY_SYSTEM_PROMPT},
+                    {"role": "user", "content": f"ENTITIES IN CLUSTER:\n{context_text[:5000]}"}
+                ],
                 temperature=0.1, # Extremely low temp for factual, concise output
                 response_format={"type": "json_object"}
             )
@@ -129,15 +176,15 @@ class GraphAnalytics:
                 "theme": result.get("theme", ""),
                 "summary": result.get("summary", ""),
                 "member_count": len(entity_ids),
+                "fingerprint": fingerprint,
                 "generated_at": datetime.now().isoformat(),
                 "pk": "Community"
             }
             
             await self.repo.create_entity(community_id, "Community", community_props)
 
-            # 5. Link members to the Community
-            for member_id in entity_ids:
-                await self.repo.create_relationship(member_id, community_id, "BELONGS_TO", {"confidence": 1.0})
+            # 5. Link members to the Community (bulk: one traversal per 100 members)
+            await self.repo.create_relationships_to(entity_ids, community_id, MEMBERSHIP_LABEL, {"confidence": 1.0})
 
             return community_id
 
@@ -145,6 +192,11 @@ class GraphAnalytics:
             logger.error(f"Failed to summarize community {cluster_id}: {e}")
             return None
 
+    def _entity_name(self, entity: Dict[str, Any]) -> Any:
+        """Display name from a projected entity (valueMap wraps values in lists)."""
+        name = entity.get('props', {}).get('name', entity.get('id'))
+        return name[0] if isinstance(name, list) and name else name
+
     def _simple_clustering(self, relationships: List[Dict[str, Any]]) -> Dict[str, List[str]]:
         """Connected Components algorithm to group IDs. (Remains sync as it is pure CPU logic)"""
         node_to_cluster = {}
@@ -152,6 +204,9 @@ class GraphAnalytics:
         cluster_count = 0
 
         for rel in relationships:
+            if rel.get("label") == MEMBERSHIP_LABEL:
+                continue
+
             # FIX: Robustly grab Source/Target IDs regardless of how the DB formatted the dictionary
             u = rel.get("outV") or rel.get("source") or rel.get("from")
             v = rel.get("inV") or rel.get("target") or rel.get("to")
@@ -183,13 +238,15 @@ class GraphAnalytics:
 
         return {k: list(v) for k, v in clusters.items()}
 
-    async def find_shortest_path(self, source_id: str, target_id: str):
-        """Finds the quickest road between two entities."""
-        query = f"g.V('{source_id}').repeat(out().simplePath()).until(hasId('{target_id}')).path().limit(1)"
+    async def find_shortest_path(self, source_id: str, target_id: str) -> List[str]:
+        """Finds the quickest road between two entities, as the ordered list of vertex ids."""
+        if source_id == target_id:
+            return [source_id]
         try:
             # FIX: Used the safe execution wrapper
-            result = await self._execute_gremlin(query)
-            return result if result else []
+            # Only the winning traverser's path is materialized, and only as ids (no vertex payloads)
+            result = await self._execute_gremlin(SHORTEST_PATH_QUERY, {"src": source_id, "dst": target_id})
+            return list(result[0].objects) if result else []
         except Exception as e:
             logger.error(f"Shortest path failed: {e}")
             return []
@@ -2,14 +2,17 @@ import logging
 import uuid
 import re
 import asyncio
+from functools import lru_cache
 import pandas as pd
 import json # Added for RCA JSON parsing
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union, BinaryIO
 from io import StringIO
-from openai import AsyncAzureOpenAI # Added for RCA Agent
 
 from app.config import settings
 from app.repositories.graph_repository import graph_repository
+from app.db.result_cache import ResultCache, graph_version
+from app.utils.batch_loader import BatchLoader
+from app.services.openai_extractor import client as openai_client # Shared Azure client for the RCA Agent
 # Note: document_processor import removed from top to avoid circular dependency
 # from app.services.openai_extractor import extract_entities_and_relationships
 
@@ -17,9 +20,172 @@ logger = logging.getLogger(__name__)
 
 # --- OPERATIONAL CATEGORIES (DB SOURCE OF TRUTH) ---
 # ADDED 'NEXT' and 'RESULTS_IN' to match the new shorter edge labels
-CAUSE_LABELS = ['CAUSE', 'LED_TO', 'CAUSES', 'CAUSED', 'TRIGGERED', 'SOURCE_OF', 'PRECEDED_BY']
-EFFECT_LABELS = ['EFFECT', 'RESULTED_IN', 'RESULTS_IN', 'IMPACTED', 'AFFECTED', 'CONSEQUENCE_OF', 'HAS_EFFECT']
-SEQUENCE_LABELS = ['NEXT', 'NEXT_STEP', 'FOLLOWED_BY', 'PRECEDES', 'THEN']
+CAUSE_LABELS = frozenset({'CAUSE', 'LED_TO', 'CAUSES', 'CAUSED', 'TRIGGERED', 'SOURCE_OF', 'PRECEDED_BY'})
+EFFECT_LABELS = frozenset({'EFFECT', 'RESULTED_IN', 'RESULTS_IN', 'IMPACTED', 'AFFECTED', 'CONSEQUENCE_OF', 'HAS_EFFECT'})
+SEQUENCE_LABELS = frozenset({'NEXT', 'NEXT_STEP', 'FOLLOWED_BY', 'PRECEDES', 'THEN'})
+
+# Case -> context edge label per node type, built once (one dict lookup per cell at ingest)
+CONTEXT_EDGE_LABELS = {
+    ctx_type: rel_label
+    for rel_label, ctx_types in {
+        # Core & People
+        "OWNED_BY": ("Customer",),
+        "ASSIGNED_TO": ("Agent",),
+        "HAS_PROFILE": ("Demographics", "MaritalStatus", "Job", "DriverProfile"),
+        # Geography
+        "LOCATED_IN": ("State", "Region", "Location", "Branch"),
+        # Vehicles & Assets
+        "HAS_VEHICLE": ("Vehicle", "VehicleMake", "VehicleModel", "VehicleAge", "VehicleClass", "VehicleSize"),
+        # Financials
+        "HAS_AMOUNT": ("Amount", "ClaimAmount", "PremiumAmount", "LoanAmount", "Deductible", "FinancialValue"),
+        "HAS_POLICY": ("Product", "Policy", "PolicyType", "Account", "AccountType", "LoanType"),
+        # Risk & Incidents
+        "INVOLVED_IN": ("Incident", "IncidentType", "IncidentSeverity"),
+        "HAS_RISK_FLAG": ("FraudFlag", "RiskLevel", "Fault"),
+        # Meta
+        "HAS_STATUS": ("Status", "Outcome"),
+        "VIA_CHANNEL": ("Channel",),
+    }.items()
+    for ctx_type in ctx_types
+}
+
+# Node/edge totals only change on writes (which bump the graph version); dashboards poll them
+stats_cache = ResultCache("stats", ttl=30)
+
+PARTITION_KEY = getattr(settings, "COSMOS_GREMLIN_PARTITION_KEY", "pk")
+
+# Static RCA instructions: identical across cases so Azure prompt caching can reuse the prefix.
+RCA_SYSTEM_PROMPT = """You are an automated Root Cause Analysis Agent.
+You will receive the business SECTOR and a CASE TIMELINE.
+
+Identify any process anomalies (e.g., Activation immediately followed by Closure).
+Extract exactly ONE Root Cause and ONE Business Effect. 
+Generate a short, downloadable client report explaining WHY this happened in the context of the given sector.
+
+Return ONLY valid JSON in this exact format:
+{
+    "root_cause_name": "Short 3-word cause",
+    "effect_name": "Short 3-word effect",
+    "client_report": "A 2-sentence explanation of why this happened and the financial/risk impact."
+}
+"""
+
+RCA_USER_PROMPT_TMPL = "SECTOR: {sector}\n\nCASE TIMELINE:\n{timeline}"
+
+# valueMap(true) keys that are element metadata rather than properties
+ELEMENT_KEYS = frozenset({'id', 'label', 'T.id', 'T.label'})
+
+# --- PARAMETERIZED QUERIES (values passed as bindings, e.g. {'nid': node_id}) ---
+NODE_CONTEXT_QUERY = (
+    "g.V(nid).project('doc', 'pk')"
+    ".by(coalesce(values('documentId'), constant('')))"
+    f".by(coalesce(values('{PARTITION_KEY}'), constant('')))"
+)
+NODE_PK_QUERY = f"g.V(nid).values('{PARTITION_KEY}')"
+EDGE_ENDPOINTS_QUERY = "g.E(eid).project('sid', 'tid', 'props').by(outV().id()).by(inV().id()).by(valueMap())"
+# Uses valueMap(true) / project() because Cosmos DB doesn't support elementMap().
+# Central node + neighbours and the connecting edges come back in ONE traversal.
+NEIGHBORHOOD_QUERY = (
+    "g.V(nid).project('nodes', 'edges')"
+    ".by(union(identity(), both()).dedup().valueMap(true).fold())"
+    ".by(bothE().dedup()"
+    ".project('id', 'label', 'inV', 'outV', 'properties')"
+    ".by(id).by(label).by(inV().id()).by(outV().id()).by(valueMap()).fold())"
+)
+
+# Precompiled coded-value patterns for _detect_type's fallback
+BRANCH_CODE_RE = re.compile(r'^b\d+$')
+CUSTOMER_CODE_RE = re.compile(r'^c\d+$')
+ISO_DATE_RE = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+def _read_csv(source: Union[str, BinaryIO]) -> pd.DataFrame:
+    """Parses CSV text, or a binary stream as UTF-8 falling back to latin-1 (same as text uploads)."""
+    if isinstance(source, str):
+        return pd.read_csv(StringIO(source))
+    try:
+        return pd.read_csv(source, encoding="utf-8")
+    except UnicodeDecodeError:
+        source.seek(0)
+        return pd.read_csv(source, encoding="latin-1")
+
+@lru_cache(maxsize=1024)
+def _header_type(header: str) -> Optional[str]:
+    """
+    Header half of GraphService._detect_type. It only depends on the column name,
+    so it runs once per column instead of once per cell (None = decide from the value).
+    """
+    h = header.lower()
+    
+    # 1. Core / Identifiers
+    if "customer" in h: return "Customer"
+    if "vendor" in h: return "Vendor"
+    if "branch" in h: return "Branch"
+    if "activity" in h or "action" in h: return "Activity"
+    if "time" in h or "date" in h: return "Time"
+    
+    # 2. Geography (Moved up to prevent 'policy_state' -> 'Policy')
+    if "state" in h: return "State"
+    if "region" in h: return "Region"
+    
+    # 3. Account & Financials
+    if "account" in h:
+        if "type" in h: return "AccountType"
+        return "Account"
+    if "product" in h: return "Product"
+    if "balance" in h or "amount" in h or "inr" in h or "$" in h: 
+        if "claim" in h: return "ClaimAmount"
+        if "loan" in h: return "LoanAmount"
+        if "premium" in h: return "PremiumAmount"
+        return "Amount"
+    if "loan_type" in h: return "LoanType"
+    if "deductible" in h: return "Deductible"
+    if "premium" in h: return "PremiumAmount"
+    if "customer_lifetime_value" in h or "clv" in h: return "CustomerLifetimeValue"
+    
+    # 4. Demographics & Profiling
+    if "job" in h: return "Job"
+    if "marital" in h: return "MaritalStatus"
+    if "age" in h or "sex" in h or "gender" in h: return "Demographics"
+    if "driverrating" in h or "experience" in h: return "DriverProfile"
+    
+    # 5. Operations & Claims
+    if "agent" in h or "repnumber" in h: return "Agent"
+    if "outcome" in h: return "Outcome"
+    if "channel" in h: return "Channel"
+    if "nps" in h: return "NPS"
+    if "claim_type" in h: return "ClaimType"
+    if "file_name" in h or "document" in h: return "Document"
+    if "pages" in h: return "PageCount"
+    if "status" in h: return "Status"
+    if "policy" in h: 
+        if "type" in h: return "PolicyType"
+        return "Policy"
+        
+    # 6. Risk, Fraud & Incidents
+    if "fraud" in h: return "FraudFlag"
+    if "risk" in h: return "RiskLevel"
+    if "accident" in h or "incident" in h:
+        if "type" in h: return "IncidentType"
+        if "severity" in h: return "IncidentSeverity"
+        if "previous" in h: return "IncidentHistory"
+        return "Incident"
+    if "fault" in h: return "Fault"
+    if "authorities" in h or "police" in h: return "Authority"
+    if "witness" in h: return "Witness"
+    
+    # 7. Vehicles & Telematics
+    if "vehicle" in h or "auto" in h or "car" in h:
+        if "class" in h: return "VehicleClass"
+        if "make" in h: return "VehicleMake"
+        if "model" in h: return "VehicleModel"
+        if "year" in h or "age" in h: return "VehicleAge"
+        if "size" in h: return "VehicleSize"
+        return "Vehicle"
+    if "device" in h: return "Device"
+    if "sensor" in h: return "SensorValue"
+    if "alarm" in h: return "AlarmClass"
+    
+    return None
 
 class GraphService:
     """
@@ -34,34 +200,23 @@ class GraphService:
 
     def __init__(self):
         self.repo = graph_repository
-        self.PARTITION_KEY = getattr(settings, "COSMOS_GREMLIN_PARTITION_KEY", "pk")
+        self.PARTITION_KEY = PARTITION_KEY
+        # Strong references to fire-and-forget work (asyncio only keeps weak refs to tasks)
+        self._background_tasks = set()
+        # get_relationships_for_entity calls issued in the same loop tick become one traversal.
+        # Worker-scoped on purpose: each /api/relationships request loads one id, so only a loader
+        # shared across requests can coalesce them. It keeps no results between ticks (see BatchLoader).
+        self.rel_loader = BatchLoader(self.repo.get_relationships_for_entities, max_batch_size=128, max_concurrency=4)
 
     # ==========================================
     # 1. HELPER METHODS
     # ==========================================
 
-    async def _run_query(self, query: str) -> Any:
+    async def _run_query(self, query: str, bindings: Dict[str, Any] = None) -> Any:
         """Helper to safely execute Gremlin queries (Returns SINGLE result)."""
         try:
-            client = getattr(self.repo, 'client', None)
-            if not client: return None
-            
-            # Handle different gremlinpython client versions securely
-            submit = getattr(client, 'submitAsync', getattr(client, 'submit_async', getattr(client, 'submit', None)))
-            if not submit: return None
-            
-            future = submit(query)
-            
-            # PROPER ASYNC AWAIT: Prevents blocking the event loop and dropping the WebSocket
-            result_set = await asyncio.wrap_future(future) if hasattr(future, 'add_done_callback') else future
-            
-            # Extract the actual data from the ResultSet
-            if hasattr(result_set, 'all'):
-                results_future = result_set.all()
-                results = await asyncio.wrap_future(results_future) if hasattr(results_future, 'add_done_callback') else results_future.result()
-            else:
-                results = result_set
-                
+            # One async-only path (shared pooled client, awaited futures, 429 retries)
+            results = await self.repo._execute_query(query, bindings)
             if results and isinstance(results, list):
                 return results[0]
             return results
@@ -69,33 +224,26 @@ class GraphService:
             logger.warning(f"Auto-Discovery Query Failed: {e}")
             return None
 
-    async def _run_query_list(self, query: str) -> List[Any]:
+    async def _run_query_list(self, query: str, bindings: Dict[str, Any] = None) -> List[Any]:
         """
         [NEW] Helper to safely execute Gremlin queries (Returns LIST of results).
         Required for get_neighbors and bulk fetches.
+        Pass values via 'bindings' so the query text stays constant (server script cache + no injection).
         """
         try:
-            client = getattr(self.repo, 'client', None)
-            if not client: return []
-            
-            submit = getattr(client, 'submitAsync', getattr(client, 'submit_async', getattr(client, 'submit', None)))
-            if not submit: return []
-            
-            future = submit(query)
-            # PROPER ASYNC AWAIT
-            result_set = await asyncio.wrap_future(future) if hasattr(future, 'add_done_callback') else future
-            
-            if hasattr(result_set, 'all'):
-                results_future = result_set.all()
-                results = await asyncio.wrap_future(results_future) if hasattr(results_future, 'add_done_callback') else results_future.result()
-            else:
-                results = result_set
-                
+            results = await self.repo._execute_query(query, bindings)
             return results if isinstance(results, list) else []
         except Exception as e:
             logger.warning(f"List Query Failed: {e}")
             return []
 
+    def _spawn_background(self, coro) -> asyncio.Task:
+        """Runs a coroutine outside the request path and keeps it alive until it finishes."""
+        task = asyncio.create_task(coro)
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return task
+
     def _is_uuid(self, val: Any) -> bool:
         """Properly checks if a string is a random UUID without using length limits."""
         try:
@@ -113,83 +261,17 @@ class GraphService:
         """
         [UPDATED] Semantic type detection based on Enterprise Data Schema.
         Maps raw CSV column headers to definitive Knowledge Graph Node Types.
+        The header rules are memoized per column; only the coded-value fallback looks at the cell.
         """
-        h = header.lower()
-        v = str(value).lower()
-        
-        # 1. Core / Identifiers
-        if "customer" in h: return "Customer"
-        if "vendor" in h: return "Vendor"
-        if "branch" in h: return "Branch"
-        if "activity" in h or "action" in h: return "Activity"
-        if "time" in h or "date" in h: return "Time"
-        
-        # 2. Geography (Moved up to prevent 'policy_state' -> 'Policy')
-        if "state" in h: return "State"
-        if "region" in h: return "Region"
-        
-        # 3. Account & Financials
-        if "account" in h:
-            if "type" in h: return "AccountType"
-            return "Account"
-        if "product" in h: return "Product"
-        if "balance" in h or "amount" in h or "inr" in h or "$" in h: 
-            if "claim" in h: return "ClaimAmount"
-            if "loan" in h: return "LoanAmount"
-            if "premium" in h: return "PremiumAmount"
-            return "Amount"
-        if "loan_type" in h: return "LoanType"
-        if "deductible" in h: return "Deductible"
-        if "premium" in h: return "PremiumAmount"
-        if "customer_lifetime_value" in h or "clv" in h: return "CustomerLifetimeValue"
-        
-        # 4. Demographics & Profiling
-        if "job" in h: return "Job"
-        if "marital" in h: return "MaritalStatus"
-        if "age" in h or "sex" in h or "gender" in h: return "Demographics"
-        if "driverrating" in h or "experience" in h: return "DriverProfile"
-        
-        # 5. Operations & Claims
-        if "agent" in h or "repnumber" in h: return "Agent"
-        if "outcome" in h: return "Outcome"
-        if "channel" in h: return "Channel"
-        if "nps" in h: return "NPS"
-        if "claim_type" in h: return "ClaimType"
-        if "file_name" in h or "document" in h: return "Document"
-        if "pages" in h: return "PageCount"
-        if "status" in h: return "Status"
-        if "policy" in h: 
-            if "type" in h: return "PolicyType"
-            return "Policy"
-            
-        # 6. Risk, Fraud & Incidents
-        if "fraud" in h: return "FraudFlag"
-        if "risk" in h: return "RiskLevel"
-        if "accident" in h or "incident" in h:
-            if "type" in h: return "IncidentType"
-            if "severity" in h: return "IncidentSeverity"
-            if "previous" in h: return "IncidentHistory"
-            return "Incident"
-        if "fault" in h: return "Fault"
-        if "authorities" in h or "police" in h: return "Authority"
-        if "witness" in h: return "Witness"
-        
-        # 7. Vehicles & Telematics
-        if "vehicle" in h or "auto" in h or "car" in h:
-            if "class" in h: return "VehicleClass"
-            if "make" in h: return "VehicleMake"
-            if "model" in h: return "VehicleModel"
-            if "year" in h or "age" in h: return "VehicleAge"
-            if "size" in h: return "VehicleSize"
-            return "Vehicle"
-        if "device" in h: return "Device"
-        if "sensor" in h: return "SensorValue"
-        if "alarm" in h: return "AlarmClass"
+        node_type = _header_type(header)
+        if node_type:
+            return node_type
         
         # 8. Regex fallbacks for coded values
-        if re.match(r'^b\d+$', v): return "Branch"
-        if re.match(r'^c\d+$', v): return "Customer"
-        if re.match(r'\d{4}-\d{2}-\d{2}', v): return "Time"
+        v = str(value).lower()
+        if BRANCH_CODE_RE.match(v): return "Branch"
+        if CUSTOMER_CODE_RE.match(v): return "Customer"
+        if ISO_DATE_RE.match(v): return "Time"
         
         return "Attribute"
 
@@ -227,64 +309,68 @@ class GraphService:
         REWRITTEN: Avoids elementMap() because Cosmos DB doesn't support it.
         Uses project() and valueMap(true) for full compatibility.
         """
-        print(f"--- [FETCH NEIGHBORS] Node ID: {node_id} ---", flush=True)
+        logger.debug("[FETCH NEIGHBORS] Node ID: %s", node_id)
         try:
-            # 1. Fetch Nodes (Central Node + Neighbors) using valueMap(true) for Cosmos support
-            nodes_query = f"g.V('{node_id}').union(identity(), both()).dedup().valueMap(true)"
-            nodes_data = await self._run_query_list(nodes_query)
-
-            # 2. Fetch Edges using project() for Cosmos DB support
-            edges_query = (
-                f"g.V('{node_id}').bothE().dedup()"
-                f".project('id', 'label', 'inV', 'outV', 'properties')"
-                f".by(id).by(label).by(inV().id()).by(outV().id()).by(valueMap())"
-            )
-            edges_data = await self._run_query_list(edges_query)
+            # 1. Nodes (Central Node + Neighbors) and 2. Edges in a single round-trip
+            result = await self._run_query_list(NEIGHBORHOOD_QUERY, {"nid": node_id})
+            data = result[0] if result else {}
 
             # 3. Format the data to match what the frontend expects
-            formatted_nodes = []
-            for n in nodes_data:
-                # Tinkerpop/Cosmos returns T.id and T.label as enums, we must stringify them
-                n_id = str(n.get('id', n.get('T.id', '')))
-                n_label = str(n.get('label', n.get('T.label', '')))
-                
-                # Clean up properties (Cosmos returns properties as lists, e.g., {'name': ['John']})
-                props = {}
-                for k, v in n.items():
-                    if k not in ['id', 'label', 'T.id', 'T.label']:
-                        props[k] = v[0] if isinstance(v, list) else v
-                
-                formatted_nodes.append({
-                    "id": n_id,
-                    "label": n_label,
-                    "properties": props
-                })
-
-            formatted_edges = []
-            for e in edges_data:
-                formatted_edges.append({
-                    "id": str(e.get('id')),
-                    "label": str(e.get('label')),
-                    "from": str(e.get('outV')),
-                    "to": str(e.get('inV')),
-                    "properties": e.get('properties', {})
-                })
-
-            return {
-                "nodes": formatted_nodes,
-                "edges": formatted_edges
-            }
+            return self._format_neighbors(data.get('nodes') or [], data.get('edges') or [])
         except Exception as e:
             logger.error(f"Error fetching neighbors for {node_id}: {str(e)}")
             return {"nodes": [], "edges": []}
 
+    def _format_neighbors(self, nodes_data: List[Dict[str, Any]], edges_data: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Shapes raw valueMap(true) nodes and projected edges into the frontend's {nodes, edges} format."""
+        formatted_nodes = []
+        for n in nodes_data:
+            # Tinkerpop/Cosmos returns T.id and T.label as enums, we must stringify them
+            n_id = str(n.get('id', n.get('T.id', '')))
+            n_label = str(n.get('label', n.get('T.label', '')))
+            
+            # Clean up properties (Cosmos returns properties as lists, e.g., {'name': ['John']})
+            props = {
+                k: (v[0] if type(v) is list and v else v)
+                for k, v in n.items() if k not in ELEMENT_KEYS
+            }
+            
+            formatted_nodes.append({
+                "id": n_id,
+                "label": n_label,
+                "properties": props
+            })
+
+        formatted_edges = []
+        for e in edges_data:
+            formatted_edges.append({
+                "id": str(e.get('id')),
+                "label": str(e.get('label')),
+                "from": str(e.get('outV')),
+                "to": str(e.get('inV')),
+                "properties": e.get('properties', {})
+            })
+
+        return {
+            "nodes": formatted_nodes,
+            "edges": formatted_edges
+        }
+
     async def get_graph(self): return await self.repo.get_graph()
     async def clear_graph(self, scope="all"): return await self.repo.clear_graph(scope)
-    async def get_stats(self): return await self.repo.get_stats()
+    async def get_stats(self):
+        cache_key = str(await graph_version.current())
+        stats = await stats_cache.get(cache_key)
+        if stats is None:
+            stats = await self.repo.get_stats()
+            await stats_cache.set(cache_key, stats)
+        return stats
     async def search_nodes(self, q): return await self.repo.search_nodes(q)
     async def get_entities(self, label: Optional[str] = None): return await self.repo.get_entities(label=label)
-    async def get_relationships_for_entity(self, entity_id: str): return await self.repo.get_relationships_for_entity(entity_id)
-    async def delete_document_data(self, doc_id: str): return await self.repo.delete_document_data(doc_id)
+    async def get_relationships_for_entity(self, entity_id: str):
+        # Concurrent per-node calls (one per visible node in the UI) share one batched traversal
+        return await self.rel_loader.load(entity_id) or []
+    async def delete_document_data(self, doc_id: str): return await self.repo.delete_data_by_filename(doc_id)
 
     # ==========================================
     # 3. CRUD OPERATIONS (FIXED FOR PK & UI)
@@ -300,8 +386,7 @@ class GraphService:
 
         # FIX: Ensure manual edges appear in the UI's Document View!
         if "doc" not in properties and "documentId" not in properties:
-            query = f"g.V('{from_id}').project('doc', 'pk').by(coalesce(values('documentId'), constant(''))).by(coalesce(values('{self.PARTITION_KEY}'), constant('')))"
-            node_data = await self._run_query(query)
+            node_data = await self._run_query(NODE_CONTEXT_QUERY, {"nid": from_id})
             
             if node_data and isinstance(node_data, dict):
                 if node_data.get('doc'):
@@ -311,7 +396,7 @@ class GraphService:
                     properties[self.PARTITION_KEY] = str(node_data['pk'])
                     properties['domain'] = str(node_data['pk'])
             
-        print(f"--- [EXECUTING ADD EDGE] Source: {from_id} | Target: {to_id} | Final Props: {properties} ---", flush=True)
+        logger.info("[EXECUTING ADD EDGE] Source: %s | Target: %s | Final Props: %s", from_id, to_id, properties)
         return await self.repo.create_relationship(from_id, to_id, rel_type, properties)
 
     async def update_relationship(self, rel_id: str, properties: Dict[str, Any]):
@@ -322,8 +407,7 @@ class GraphService:
         Safely changes an Edge's Type (Label) dynamically.
         """
         if new_props is None: new_props = {}
-        query = f"g.E('{rel_id}').project('sid', 'tid', 'props').by(outV().id()).by(inV().id()).by(valueMap())"
-        edge_data = await self._run_query(query)
+        edge_data = await self._run_query(EDGE_ENDPOINTS_QUERY, {"eid": rel_id})
 
         if not edge_data or not isinstance(edge_data, dict): 
             return {"error": "Relationship not found"}
@@ -339,11 +423,14 @@ class GraphService:
     async def delete_relationship(self, rel_id: str):
         return await self.repo.delete_relationship(rel_id)
 
-    async def update_entity(self, entity_id: str, payload: Dict[str, Any], partition_key: str = None):
+    async def update_entity(self, entity_id: str, payload: Dict[str, Any], partition_key: str = None,
+                            label: Optional[str] = None) -> Optional[int]:
         """
         Updates node properties cleanly without corrupting Types or losing PKs.
+        'label' is the node's vertex label when the caller knows it (saves a read on renames).
+        Returns the shared graph version the write produced (None without Redis).
         """
-        print(f"--- [UPDATE REQUEST RECEIVED] Node ID: {entity_id} | Provided PK/Doc: {partition_key} ---", flush=True)
+        logger.info("[UPDATE REQUEST RECEIVED] Node ID: %s | Provided PK/Doc: %s", entity_id, partition_key)
         
         true_pk = partition_key
         
@@ -374,10 +461,10 @@ class GraphService:
 
         # 4. AUTO-DISCOVER the true PK if we don't have it using the sync helper
         if not true_pk:
-            val = await self._run_query(f"g.V('{entity_id}').values('{self.PARTITION_KEY}')")
+            val = await self._run_query(NODE_PK_QUERY, {"nid": entity_id})
             if val:
                 true_pk = str(val)
-                print(f"--- [AUTO-DISCOVERY] Found PK '{true_pk}' for updating node '{entity_id}' ---", flush=True)
+                logger.info("[AUTO-DISCOVERY] Found PK '%s' for updating node '%s'", true_pk, entity_id)
 
         # 5. ASSEMBLE FINAL PROPERTIES FOR THE DATABASE
         final_props = {**inner_props}
@@ -398,15 +485,29 @@ class GraphService:
             final_props["type"] = clean_type
             final_props["entityType"] = clean_type
 
-        print(f"--- [EXECUTING UPDATE] Node ID: {entity_id} | Final PK: {true_pk} | Properties: {list(final_props.keys())} ---", flush=True)
-        return await self.repo.update_entity(entity_id, final_props)
+        logger.info("[EXECUTING UPDATE] Node ID: %s | Final PK: %s | Properties: %s", entity_id, true_pk, list(final_props))
+        return await self.repo.update_entity(entity_id, final_props, label=label)
 
     async def delete_entity(self, entity_id: str, partition_key: str = None):
         """
         Deletes a node securely using precise Partition Key targeting.
         """
-        print(f"--- [DELETE REQUEST RECEIVED] Node ID: {entity_id} | Provided PK/Doc: {partition_key} ---", flush=True)
-        
+        logger.info("[DELETE REQUEST RECEIVED] Node ID: %s | Provided PK/Doc: %s", entity_id, partition_key)
+        true_pk = await self._resolve_delete_pk(entity_id, partition_key)
+        logger.info("[EXECUTING DELETE] Node ID: %s | Final PK: %s", entity_id, true_pk)
+        return await self.repo.delete_entity(entity_id, true_pk)
+
+    async def delete_entities(self, keys: List[tuple]) -> None:
+        """
+        Batch form of delete_entity for (entity_id, partition_key) pairs: partition keys are resolved
+        the same way, then the vertices are dropped per partition (GraphRepository.delete_entities).
+        """
+        pks = await asyncio.gather(*(self._resolve_delete_pk(eid, pk) for eid, pk in keys))
+        logger.info("[EXECUTING BATCH DELETE] %d nodes", len(keys))
+        await self.repo.delete_entities([(eid, pk) for (eid, _), pk in zip(keys, pks)])
+
+    async def _resolve_delete_pk(self, entity_id: str, partition_key: str = None) -> Optional[str]:
+        """Partition key to target when deleting a node: the one supplied if usable, else discovered."""
         true_pk = partition_key
 
         # 1. STRIP THE API ROUTER FALLBACK
@@ -423,18 +524,21 @@ class GraphService:
 
         # 4. Auto-Discover the specific node's PK using the sync helper
         if not true_pk:
-            val = await self._run_query(f"g.V('{entity_id}').values('{self.PARTITION_KEY}')")
+            val = await self._run_query(NODE_PK_QUERY, {"nid": entity_id})
             if val:
                 true_pk = str(val)
-                print(f"--- [AUTO-DISCOVERY] Found PK '{true_pk}' for deleting node '{entity_id}' ---", flush=True)
-
-        print(f"--- [EXECUTING DELETE] Node ID: {entity_id} | Final PK: {true_pk} ---", flush=True)
-        return await self.repo.delete_entity(entity_id, true_pk)
+                logger.info("[AUTO-DISCOVERY] Found PK '%s' for deleting node '%s'", true_pk, entity_id)
+        return true_pk
 
-    async def add_entities(self, entities):
+    async def add_entities(self, entities) -> List[str]:
         """
         Creates nodes. Handles both Bulk Load (CSV) and Manual Creation (UI).
+        Returns the vertex id written for each input entity, in input order (ids are derived from type + name).
+        Upserts run concurrently with one graph version bump for the call (GraphRepository.create_entities).
         """
+        # (id, partition) -> (label, props); repeats merge in order, as back-to-back upserts would
+        pending: Dict[tuple, tuple] = {}
+        written_ids: List[str] = []
         for e in entities:
             raw_label = e.get("label", "Concept")
             props = e.get("properties", {})
@@ -458,6 +562,12 @@ class GraphService:
             props[self.PARTITION_KEY] = target_pk
 
             # --- 2. CLEAN ID & TYPE ---
+            # UI 'type' -> DB 'normType' (an explicit normType wins)
+            if "normType" not in props:
+                declared_type = e.get("type") or props.get("type")
+                if declared_type:
+                    props["normType"] = declared_type
+
             if "normType" in props:
                 node_type = props["normType"]
             else:
@@ -473,11 +583,23 @@ class GraphService:
             # Generate Deterministic ID (e.g. 'Person_Janani')
             clean_id = self._clean_id(node_type, node_name)
             
-            # --- 3. SAVE ---
-            await self.repo.create_entity(clean_id, raw_label, props)
+            written_ids.append(clean_id)
+            key = (clean_id, target_pk)
+            if key in pending:
+                pending[key][1].update(props)
+            else:
+                pending[key] = (raw_label, dict(props))
+
+        # --- 3. SAVE ---
+        # One upsert per distinct vertex (two never race to addV the same id)
+        await self.repo.create_entities([(cid, label, props) for (cid, _), (label, props) in pending.items()])
+        return written_ids
 
     async def add_relationships(self, relationships):
-        for i, r in enumerate(relationships):
+        # (from, to, label) -> props; repeats merge in order, as back-to-back upserts would.
+        # Two upserts of one edge in the same concurrent batch would both miss outE() and both addE().
+        pending: Dict[tuple, Dict[str, Any]] = {}
+        for r in relationships:
             # --- CRITICAL: THIS SAVES THE CATEGORY TO DB ---
             props = r.get("properties", {})
             risk = self._determine_risk_category(r["label"])
@@ -488,12 +610,15 @@ class GraphService:
             edge_id = r.get("id")
             if edge_id:
                 props["edge_id"] = edge_id
-            
-            await self.repo.create_relationship(r["from"], r["to"], r["label"], props)
-            
-            # Throttle to prevent 429 errors during massive uploads
-            if i % 10 == 0:
-                await asyncio.sleep(0.05)
+
+            key = (r["from"], r["to"], r["label"])
+            if key in pending:
+                pending[key].update(props)
+            else:
+                pending[key] = dict(props)
+
+        # Written in small concurrent batches, throttled to prevent 429 errors during massive uploads
+        await self.repo.create_relationships([(f, t, label, props) for (f, t, label), props in pending.items()])
 
     # ==========================================
     # 3.5 AI RISK INGESTION AGENT
@@ -554,35 +679,16 @@ class GraphService:
                 return
 
             timeline_events.sort(key=lambda x: x["date"])
-            timeline_text = "\n".join([e["desc"] for e in timeline_events])
-
-            # 2. Call OpenAI for Root Cause Analysis
-            ai_client = AsyncAzureOpenAI(
-                api_key=settings.AZURE_OPENAI_API_KEY,
-                api_version=settings.AZURE_OPENAI_API_VERSION,
-                azure_endpoint=settings.AZURE_OPENAI_ENDPOINT
-            )
-
-            prompt = f"""
-            You are an automated Root Cause Analysis Agent for the {domain.upper()} sector.
-            Analyze this case timeline:
-            {timeline_text}
+            timeline_text = "\n".join(e["desc"] for e in timeline_events)
 
-            Identify any process anomalies (e.g., Activation immediately followed by Closure).
-            Extract exactly ONE Root Cause and ONE Business Effect. 
-            Generate a short, downloadable client report explaining WHY this happened in the context of the {domain.upper()} sector.
-            
-            Return ONLY valid JSON in this exact format:
-            {{
-                "root_cause_name": "Short 3-word cause",
-                "effect_name": "Short 3-word effect",
-                "client_report": "A 2-sentence explanation of why this happened and the financial/risk impact."
-            }}
-            """
-
-            response = await ai_client.chat.completions.create(
+            # 2. Call OpenAI for Root Cause Analysis (shared client: no per-case TLS handshake)
+            # Static instructions first (cacheable prefix), per-case data last
+            response = await openai_client.chat.completions.create(
                 model=settings.AZURE_OPENAI_DEPLOYMENT_NAME,
-                messages=[{"role": "user", "content": prompt}],
+                messages=[
+                    {"role": "system", "content": RCA_SYSTEM_PROMPT},
+                    {"role": "user", "content": RCA_USER_PROMPT_TMPL.format(sector=domain.upper(), timeline=timeline_text)}
+                ],
                 temperature=0.1,
                 response_format={"type": "json_object"}
             )
@@ -628,17 +734,23 @@ class GraphService:
     async def process_narrative(self, narrative_text: str, filename: str) -> Dict[str, Any]:
         logger.info(f"Processing: {filename}")
         
-        # Use helper to get domain (matches the logic in _derive_domain)
-        domain = filename.split('_')[0] if "_" in filename else "general"
+        # Same partition add_entities derives, so the RCA nodes land next to the document's own
+        domain = self._derive_domain(filename)
 
         if filename.lower().endswith(".csv") or "," in narrative_text:
             return await self._process_csv_graph(narrative_text, filename, domain)
         return await self._process_unstructured_text(narrative_text, filename, domain)
 
-    async def _process_csv_graph(self, csv_text: str, filename: str, domain: str):
-        print(f"--- PROCESS FLOW ENGINE: Processing {filename} ---", flush=True)
+    async def process_csv_file(self, csv_file: BinaryIO, filename: str) -> Dict[str, Any]:
+        """CSV upload straight from its binary stream: pandas parses the file, no full bytes/str copies."""
+        logger.info(f"Processing: {filename}")
+        return await self._process_csv_graph(csv_file, filename, self._derive_domain(filename))
+
+    async def _process_csv_graph(self, csv_source: Union[str, BinaryIO], filename: str, domain: str):
+        logger.info("PROCESS FLOW ENGINE: Processing %s", filename)
         try:
-            df = pd.read_csv(StringIO(csv_text))
+            # Parsing a multi-MB upload is pure CPU: keep it off the event loop
+            df = await asyncio.to_thread(_read_csv, csv_source)
         except:
             return {"error": "Invalid CSV"}
 
@@ -681,7 +793,7 @@ class GraphService:
         total_rows = len(df)
         
         for idx, row in df.iterrows():
-            if idx % 50 == 0: print(f"Processing row {idx}/{total_rows}...", flush=True)
+            if idx % 50 == 0: logger.info("Processing row %d/%d...", idx, total_rows)
 
             # B. CASE NODE
             case_val = str(row[case_col]).strip()
@@ -771,30 +883,8 @@ class GraphService:
 
                 # 2. LINK CASE -> CONTEXT (Semantic Edges)
                 else:
-                    rel_label = "LINKED_TO" # Fallback
-                    
-                    # Core & People
-                    if ctx_type == "Customer": rel_label = "OWNED_BY"
-                    elif ctx_type == "Agent": rel_label = "ASSIGNED_TO"
-                    elif ctx_type in ["Demographics", "MaritalStatus", "Job", "DriverProfile"]: rel_label = "HAS_PROFILE"
-                    
-                    # Geography
-                    elif ctx_type in ["State", "Region", "Location", "Branch"]: rel_label = "LOCATED_IN"
-                    
-                    # Vehicles & Assets
-                    elif ctx_type in ["Vehicle", "VehicleMake", "VehicleModel", "VehicleAge", "VehicleClass", "VehicleSize"]: rel_label = "HAS_VEHICLE"
-                    
-                    # Financials
-                    elif ctx_type in ["Amount", "ClaimAmount", "PremiumAmount", "LoanAmount", "Deductible", "FinancialValue"]: rel_label = "HAS_AMOUNT"
-                    elif ctx_type in ["Product", "Policy", "PolicyType", "Account", "AccountType", "LoanType"]: rel_label = "HAS_POLICY"
-                    
-                    # Risk & Incidents
-                    elif ctx_type in ["Incident", "IncidentType", "IncidentSeverity"]: rel_label = "INVOLVED_IN"
-                    elif ctx_type in ["FraudFlag", "RiskLevel", "Fault"]: rel_label = "HAS_RISK_FLAG"
-                    
-                    # Meta
-                    elif ctx_type in ["Status", "Outcome"]: rel_label = "HAS_STATUS"
-                    elif ctx_type == "Channel": rel_label = "VIA_CHANNEL"
+                    # Semantic edge label for this context type, LINKED_TO as the fallback
+                    rel_label = CONTEXT_EDGE_LABELS.get(ctx_type, "LINKED_TO")
                     
                     # Injecting time_val into the key ensures overlapping events fan out
                     edge_unique_key = f"{case_id}_{ctx_id}_{rel_label}_{time_val}"
@@ -870,13 +960,25 @@ class GraphService:
                 if case_ref:
                     anomalous_cases.add(self._clean_id("Case", case_ref))
 
+        # Store the document's counts now so listings don't have to aggregate them
+        await self.repo.refresh_document_counts(filename)
+
         # Launch background analysis for identified cases
-        for a_case in anomalous_cases:
-            asyncio.create_task(self._run_post_ingestion_rca(a_case, domain, filename))
+        rca_tasks = [
+            self._spawn_background(self._run_post_ingestion_rca(a_case, domain, filename))
+            for a_case in anomalous_cases
+        ]
+        # RCA adds RootCause/BusinessEffect nodes to the document: recount once they have all landed
+        if rca_tasks:
+            self._spawn_background(self._refresh_counts_after(rca_tasks, filename))
         # -----------------------------------------
 
         return {"filename": filename, "entities": len(all_entities_list)}
 
+    async def _refresh_counts_after(self, tasks: List[asyncio.Task], filename: str):
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.repo.refresh_document_counts(filename)
+
     async def _process_unstructured_text(self, text, filename, domain):
         # Placeholder for AI logic
         return {"status": "skipped", "msg": "AI Mode not active"}
@@ -0,0 +1,67 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+
+class BatchLoader:
+    """
+    DataLoader-style coalescing of concurrent single-key lookups.
+    - load(key) calls made in the same event-loop tick are collected and resolved by ONE batch_fn call.
+    - batch_fn receives unique keys (at most 'max_batch_size' per call) and returns {key: value};
+      keys it leaves out resolve to 'default'.
+    - Nothing is cached between batches: every tick reads fresh data.
+    - At most 'max_concurrency' batch_fn calls run at once; later batches wait their turn.
+    Lifetime: one loader is meant to live as long as its worker process, so concurrent requests on
+    the same event loop share batches (a per-request loader would never see a second key on a
+    one-id route). It only ever holds the current tick's waiters and in-flight batches; if it is
+    used from a new event loop (e.g. a restarted app in tests), that state is reset.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]],
+                 max_batch_size: int = 128, max_concurrency: int = 4, default: Any = None):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.default = default
+        self._pending: Dict[Hashable, List[asyncio.Future]] = {}
+        # Strong references to in-flight batches (the loop only keeps weak ones)
+        self._tasks: Set[asyncio.Task] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def load(self, key: Hashable) -> Any:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            self._pending = {}
+            self._tasks = set()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        if not self._pending:
+            loop.call_soon(self._dispatch)
+        future = loop.create_future()
+        self._pending.setdefault(key, []).append(future)
+        return await future
+
+    def _dispatch(self) -> None:
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        for i in range(0, len(keys), self.max_batch_size):
+            chunk = keys[i:i + self.max_batch_size]
+            task = asyncio.ensure_future(self._resolve(chunk, {key: pending[key] for key in chunk}))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, keys: List[Hashable], waiters: Dict[Hashable, List[asyncio.Future]]) -> None:
+        try:
+            async with self._semaphore:
+                results = await self.batch_fn(keys)
+        except Exception as exc:
+            for futures in waiters.values():
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(exc)
+            return
+        for key, futures in waiters.items():
+            value = results.get(key, self.default)
+            for future in futures:
+                if not future.done():
+                    future.set_result(value)
@@ -0,0 +1,56 @@
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """
+    Minimal circuit breaker for calls to a degraded dependency (e.g. Azure OpenAI).
+    - CLOSED: calls go through; consecutive failures are counted.
+    - OPEN: after 'fail_max' consecutive failures, calls are skipped for 'reset_timeout' seconds.
+    - HALF-OPEN: after the cool-down, one trial call is let through;
+      success closes the circuit, failure re-opens it.
+    """
+
+    def __init__(self, name: str, fail_max: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """Returns True if the protected call should be attempted."""
+        if self._opened_at is None:
+            return True
+        if time.monotonic() - self._opened_at < self.reset_timeout:
+            return False
+        # Half-open: let exactly one trial call through
+        if self._trial_in_flight:
+            return False
+        self._trial_in_flight = True
+        return True
+
+    def record_success(self) -> None:
+        if self._opened_at is not None:
+            logger.info(f"Circuit '{self.name}' closed again")
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    def release(self) -> None:
+        """Ends a call that neither succeeded nor failed (e.g. cancelled), so a half-open trial is not lost."""
+        self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self._failures += 1
+        self._trial_in_flight = False
+        if self._opened_at is not None or self._failures >= self.fail_max:
+            self._opened_at = time.monotonic()
+            logger.warning(f"Circuit '{self.name}' open for {self.reset_timeout}s after {self._failures} failures")